@@ -1,13 +1,17 @@
 from binascii import hexlify
 
+import struct
+
 from helper import (
+    ByteCursor,
+    ByteWriter,
+    StreamCursor,
     double_sha256,
-    int_to_little_endian,
     little_endian_to_int,
+    MerkleAccumulator,
     merkle_parent,
     merkle_parent_level,
     merkle_path,
-    merkle_root,
 )
 
 
@@ -51,6 +55,8 @@ class Proof:
 
 
 class Block:
+    # version, prev_block, merkle_root, timestamp, bits and nonce
+    header = struct.Struct('<I32s32sI4s4s')
 
     def __init__(self, version, prev_block, merkle_root, timestamp,
                  bits, nonce, tx_hashes=None):
@@ -66,37 +72,52 @@ class Block:
     @classmethod
     def parse(cls, s):
         '''Takes a byte stream and parses a block. Returns a Block object'''
-        # s.read(n) will read n bytes from the stream
+        # the whole 80 byte header is read in one go:
         # version - 4 bytes, little endian, interpret as int
-        version = little_endian_to_int(s.read(4))
         # prev_block - 32 bytes, little endian (use [::-1] to reverse)
-        prev_block = s.read(32)[::-1]
         # merkle_root - 32 bytes, little endian (use [::-1] to reverse)
-        merkle_root = s.read(32)[::-1]
         # timestamp - 4 bytes, little endian, interpret as int
-        timestamp = little_endian_to_int(s.read(4))
         # bits - 4 bytes
-        bits = s.read(4)
         # nonce - 4 bytes
-        nonce = s.read(4)
+        header = cls.header
+        if isinstance(s, (StreamCursor, bytes, bytearray, memoryview)):
+            # a cursor reads it straight out of bytes
+            fields = ByteCursor.wrap(s).unpack(header)
+        else:
+            # from a stream it's a single read, which is quicker than
+            # setting up a cursor to do it
+            raw = s.read(header.size)
+            if len(raw) != header.size:
+                raise RuntimeError('needed {} bytes, got {}'.format(header.size, len(raw)))
+            fields = header.unpack(raw)
+        version, prev_block, merkle_root, timestamp, bits, nonce = fields
         # initialize class
-        return cls(version, prev_block, merkle_root, timestamp, bits, nonce)
+        return cls(version, prev_block[::-1], merkle_root[::-1], timestamp, bits, nonce)
 
     def serialize(self):
         '''Returns the 80 byte block header'''
+        writer = ByteWriter()
+        self.serialize_into(writer)
+        return writer.getvalue()
+
+    def serialize_into(self, writer):
+        '''Writes the 80 byte block header to the ByteWriter writer'''
+        # the whole header is packed in one go, like it's parsed:
         # version - 4 bytes, little endian
-        result = int_to_little_endian(self.version, 4)
         # prev_block - 32 bytes, little endian
-        result += self.prev_block[::-1]
         # merkle_root - 32 bytes, little endian
-        result += self.merkle_root[::-1]
         # timestamp - 4 bytes, little endian
-        result += int_to_little_endian(self.timestamp, 4)
         # bits - 4 bytes
-        result += self.bits
         # nonce - 4 bytes
-        result += self.nonce
-        return result
+        # the struct would pad a short field with zeros or cut a long one,
+        # which makes a different block hash instead of an error
+        for name, size in (('prev_block', 32), ('merkle_root', 32),
+                           ('bits', 4), ('nonce', 4)):
+            if len(getattr(self, name)) != size:
+                raise RuntimeError('{} should be {} bytes, not {}'.format(
+                    name, size, len(getattr(self, name))))
+        writer.pack(self.header, self.version, self.prev_block[::-1],
+                    self.merkle_root[::-1], self.timestamp, self.bits, self.nonce)
 
     def hash(self):
         '''Returns the double-sha256 interpreted little endian of the block'''
@@ -157,9 +178,8 @@ class Block:
         the same as the merkle root of this block.
         '''
         # reverse all the transaction hashes (self.tx_hashes)
-        hashes = [h[::-1] for h in self.tx_hashes]
-        # get the Merkle Root
-        root = merkle_root(hashes)
+        # and get the Merkle Root one hash at a time
+        root = MerkleAccumulator(h[::-1] for h in self.tx_hashes).root()
         # reverse the Merkle Root
         # return whether self.merkle root is the same as
         # the reverse of the calculated merkle root
@@ -176,6 +196,10 @@ class Block:
         current_level = [h[::-1] for h in self.tx_hashes]
         # if there is more than 1 hash:
         while len(current_level) > 1:
+            # an odd level gets its last hash duplicated, as
+            # merkle_parent_level does, so that it has a partner in the proof
+            if len(current_level) % 2 == 1:
+                current_level = current_level + [current_level[-1]]
             # store current level in self.merkle_tree
             self.merkle_tree.append(current_level)
             # Make current level Merkle Parent level
@@ -3,6 +3,7 @@ from io import BytesIO
 from unittest import TestCase
 
 from block import Block, Proof
+from helper import ByteCursor
 
 
 class BlockTest(TestCase):
@@ -19,12 +20,20 @@ class BlockTest(TestCase):
         self.assertEqual(block.timestamp, 0x59a7771e)
         self.assertEqual(block.bits, unhexlify('e93c0118'))
         self.assertEqual(block.nonce, unhexlify('a4ffd71d'))
+        # the same from a cursor
+        cursor = ByteCursor(block_raw)
+        self.assertEqual(Block.parse(cursor).serialize(), block_raw)
+        self.assertEqual(cursor.remaining(), 0)
 
     def test_serialize(self):
         block_raw = unhexlify('020000208ec39428b17323fa0ddec8e887b4a7c53b8c0a0a220cfd0000000000000000005b0750fce0a889502d40508d39576821155e9c9e3f5c3157f961db38fd8b25be1e77a759e93c0118a4ffd71d')
         stream = BytesIO(block_raw)
         block = Block.parse(stream)
         self.assertEqual(block.serialize(), block_raw)
+        # a field of the wrong length is an error, not padded or cut
+        block.prev_block = block.prev_block[1:]
+        with self.assertRaises(RuntimeError):
+            block.serialize()
 
     def test_hash(self):
         block_raw = unhexlify('020000208ec39428b17323fa0ddec8e887b4a7c53b8c0a0a220cfd0000000000000000005b0750fce0a889502d40508d39576821155e9c9e3f5c3157f961db38fd8b25be1e77a759e93c0118a4ffd71d')
@@ -1,14 +1,22 @@
 from binascii import hexlify
-from io import BytesIO
 
+import atexit
 import hmac
 import hashlib
+import mmap
+import os
+import struct
+import sys
+import time
+import warnings
 
 from helper import (
     decode_base58,
     encode_base58_checksum,
     hash160,
-    p2pkh_script
+    map_chunks,
+    p2pkh_script,
+    LRUCache,
 )
 
 
@@ -198,6 +206,42 @@ P = 2**256 - 2**32 - 977
 N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
 
 
+# secp256k1 has an efficiently computable endomorphism: for BETA, a cube
+# root of unity mod P, (x, y) -> (BETA*x, y) is the same as multiplying
+# by LAMBDA, a cube root of unity mod N. Writing k as k1 + k2*LAMBDA with
+# k1 and k2 around 128 bits each halves the doublings needed (GLV).
+BETA = 0x7ae96a2b657c07106e64479eac3434e99cf0497512f58995c1396c28719501ee
+LAMBDA = 0x5363ad4cc05c30e0a5261c028812645a122e22ea20816678df02967c1b23bd72
+# short basis (a1, b1), (a2, b2) of the lattice a + b*LAMBDA == 0 mod N
+GLV_A1 = 0x3086d221a7d46bcde86c90e49284eb15
+GLV_B1 = -0xe4437ed6010e88286f547fa90abfe4c3
+GLV_A2 = 0x114ca50f7a8e2f3f657c1108d9d44cfd8
+GLV_B2 = GLV_A1
+
+
+def sqrt_mod_p(a):
+    '''Returns a**((P+1)/4) mod P, which is a square root of a when it
+    has one, using an addition chain for the exponent'''
+    # P = 3 mod 4, so a**((P+1)/4) squared is a**((P-1)/2) * a, which is a
+    # when a is a square. In binary (P+1)/4 is 223 ones, a 0, 22 ones and
+    # then 0b00001100. xN below is a**(2**N - 1) and xN**(2**M) * xM is
+    # x(N+M). The runs of squarings go through pow, which does them in C.
+    x2 = a * a % P * a % P
+    x3 = x2 * x2 % P * a % P
+    x6 = pow(x3, 1 << 3, P) * x3 % P
+    x9 = pow(x6, 1 << 3, P) * x3 % P
+    x11 = pow(x9, 1 << 2, P) * x2 % P
+    x22 = pow(x11, 1 << 11, P) * x11 % P
+    x44 = pow(x22, 1 << 22, P) * x22 % P
+    x88 = pow(x44, 1 << 44, P) * x44 % P
+    x176 = pow(x88, 1 << 88, P) * x88 % P
+    x220 = pow(x176, 1 << 44, P) * x44 % P
+    x223 = pow(x220, 1 << 3, P) * x3 % P
+    t = pow(x223, 1 << 23, P) * x22 % P
+    t = pow(t, 1 << 6, P) * x2 % P
+    return pow(t, 4, P)
+
+
 class S256Field(FieldElement):
 
     def __init__(self, num, prime=None):
@@ -210,58 +254,490 @@ class S256Field(FieldElement):
         return self.hex()
 
     def sqrt(self):
-        return self**((P+1)//4)
+        return self.__class__(sqrt_mod_p(self.num))
+
+
+# Jacobian coordinates: (X, Y, Z) represents the affine point
+# (X/Z**2, Y/Z**3). Adding and doubling in this form needs no field
+# inversions, so scalar multiplication only inverts once at the very end.
+# These work on raw integers mod P; Z == 0 is the point at infinity.
+JACOBIAN_INFINITY = (0, 1, 0)
+
+
+def jacobian_double(p):
+    x1, y1, z1 = p
+    if z1 == 0 or y1 == 0:
+        return JACOBIAN_INFINITY
+    # dbl-2009-l, valid because a == 0 for secp256k1
+    xx = x1 * x1 % P
+    yy = y1 * y1 % P
+    yyyy = yy * yy % P
+    d = 2 * ((x1 + yy) ** 2 - xx - yyyy) % P
+    e = 3 * xx % P
+    x3 = (e * e - 2 * d) % P
+    y3 = (e * (d - x3) - 8 * yyyy) % P
+    z3 = 2 * y1 * z1 % P
+    return (x3, y3, z3)
+
+
+def jacobian_add(p, q):
+    x1, y1, z1 = p
+    x2, y2, z2 = q
+    if z1 == 0:
+        return q
+    if z2 == 0:
+        return p
+    z1z1 = z1 * z1 % P
+    z2z2 = z2 * z2 % P
+    u1 = x1 * z2z2 % P
+    u2 = x2 * z1z1 % P
+    s1 = y1 * z2 * z2z2 % P
+    s2 = y2 * z1 * z1z1 % P
+    h = (u2 - u1) % P
+    r = (s2 - s1) % P
+    if h == 0:
+        # same x coordinate: either the same point or inverses
+        if r == 0:
+            return jacobian_double(p)
+        return JACOBIAN_INFINITY
+    hh = h * h % P
+    hhh = h * hh % P
+    v = u1 * hh % P
+    x3 = (r * r - hhh - 2 * v) % P
+    y3 = (r * (v - x3) - s1 * hhh) % P
+    z3 = h * z1 * z2 % P
+    return (x3, y3, z3)
+
+
+def jacobian_add_affine(p, q):
+    '''Adds the affine point q = (x, y) to the Jacobian point p. Knowing
+    that q has Z == 1 saves several multiplications over jacobian_add.'''
+    x1, y1, z1 = p
+    x2, y2 = q
+    if z1 == 0:
+        return (x2, y2, 1)
+    z1z1 = z1 * z1 % P
+    u2 = x2 * z1z1 % P
+    s2 = y2 * z1 * z1z1 % P
+    h = (u2 - x1) % P
+    r = (s2 - y1) % P
+    if h == 0:
+        if r == 0:
+            return jacobian_double(p)
+        return JACOBIAN_INFINITY
+    hh = h * h % P
+    hhh = h * hh % P
+    v = x1 * hh % P
+    x3 = (r * r - hhh - 2 * v) % P
+    y3 = (r * (v - x3) - y1 * hhh) % P
+    z3 = z1 * h % P
+    return (x3, y3, z3)
+
+
+def jacobian_negate(p):
+    '''Returns -p for both Jacobian and affine tuples'''
+    return (p[0], (P - p[1]) % P) + p[2:]
+
+
+def jacobian_odd_multiples(p, count):
+    '''Returns [p, 3p, 5p, ...] with count entries'''
+    double = jacobian_double(p)
+    result = [p]
+    for _ in range(count - 1):
+        result.append(jacobian_add(result[-1], double))
+    return result
+
+
+def wnaf(k, width):
+    '''Returns the width-w non-adjacent form of k, least significant digit
+    first. Every non-zero digit is odd and less than 2**(width-1) in
+    absolute value, and is followed by at least width-1 zeros.'''
+    digits = []
+    window = 1 << width
+    half = window >> 1
+    while k:
+        if k & 1:
+            digit = k & (window - 1)
+            if digit >= half:
+                digit -= window
+            k -= digit
+        else:
+            digit = 0
+        digits.append(digit)
+        k >>= 1
+    return digits
+
+
+def jacobian_straus(terms):
+    '''Returns the sum of k*p for each (wnaf(k), odd multiples of p) in terms
+    using one shared chain of doublings (Straus/Shamir interleaving)'''
+    length = max([len(digits) for digits, _ in terms] + [0])
+    # tables of affine (x, y) points can use the cheaper mixed addition
+    terms = [
+        (digits, multiples,
+         jacobian_add_affine if len(multiples[0]) == 2 else jacobian_add)
+        for digits, multiples in terms]
+    result = JACOBIAN_INFINITY
+    for i in range(length - 1, -1, -1):
+        result = jacobian_double(result)
+        for digits, multiples, add in terms:
+            if i >= len(digits):
+                continue
+            digit = digits[i]
+            if digit > 0:
+                result = add(result, multiples[digit >> 1])
+            elif digit < 0:
+                result = add(result, jacobian_negate(multiples[-digit >> 1]))
+    return result
+
+
+def jacobian_endomorphism(p):
+    '''Returns LAMBDA*p, which only takes one multiplication. Works for
+    both Jacobian and affine tuples.'''
+    return (BETA * p[0] % P,) + p[1:]
+
+
+def glv_split(k):
+    '''Returns k1, k2 with k1 + k2*LAMBDA == k mod N, both at most 128 bits
+    in absolute value'''
+    c1 = (GLV_B2 * k + N // 2) // N
+    c2 = (-GLV_B1 * k + N // 2) // N
+    k1 = k - c1 * GLV_A1 - c2 * GLV_A2
+    k2 = -c1 * GLV_B1 - c2 * GLV_B2
+    return k1, k2
+
+
+def glv_terms(k, multiples, width, lambda_multiples=None):
+    '''Returns the jacobian_straus terms for k times the point whose odd
+    multiples are given, split in two with the endomorphism'''
+    if lambda_multiples is None:
+        lambda_multiples = [jacobian_endomorphism(m) for m in multiples]
+    terms = []
+    for part, table in zip(glv_split(k), (multiples, lambda_multiples)):
+        if part < 0:
+            digits = [-digit for digit in wnaf(-part, width)]
+        else:
+            digits = wnaf(part, width)
+        terms.append((digits, table))
+    return terms
+
+
+def pippenger_window(count):
+    '''Returns the bucket window width for jacobian_pippenger with count
+    terms of up to 129 bits: each of the 129/width windows costs one mixed
+    addition per term and about two full additions (each ~1.4 mixed ones)
+    per bucket, and there are 2**(width-1) buckets'''
+    return min(
+        range(2, 17),
+        key=lambda width: (129 // width + 1) * (count + 2.8 * (1 << (width - 1))))
+
+
+def jacobian_pippenger(terms, width):
+    '''Returns the sum of k*p for each (k, p) in terms, where k >= 0 and p
+    is an affine (x, y) point, using Pippenger's bucket method. For each
+    window of width bits, every point is added to the bucket of its digit
+    and then the buckets are summed once, so the work per term stays about
+    one addition per window however many terms there are.'''
+    bits = max([k.bit_length() for k, _ in terms] + [0])
+    windows = bits // width + 1
+    half = 1 << (width - 1)
+    mask = (1 << width) - 1
+    # signed digits from -half to half, so only half the buckets are needed
+    # and a negative digit adds the negated point
+    digits = []
+    for k, _ in terms:
+        row = []
+        for _ in range(windows):
+            digit = k & mask
+            k >>= width
+            if digit > half:
+                digit -= 1 << width
+                k += 1
+            row.append(digit)
+        digits.append(row)
+    points = [p for _, p in terms]
+    negated = [jacobian_negate(p) for p in points]
+    result = JACOBIAN_INFINITY
+    for i in range(windows - 1, -1, -1):
+        for _ in range(width):
+            result = jacobian_double(result)
+        buckets = [JACOBIAN_INFINITY] * (half + 1)
+        for row, point, negative in zip(digits, points, negated):
+            digit = row[i]
+            if digit > 0:
+                buckets[digit] = jacobian_add_affine(buckets[digit], point)
+            elif digit < 0:
+                buckets[-digit] = jacobian_add_affine(buckets[-digit], negative)
+        # sum of j*buckets[j]: running is buckets[j] + ... + buckets[half]
+        # and gets added to total once for every j
+        running = total = JACOBIAN_INFINITY
+        for j in range(half, 0, -1):
+            running = jacobian_add(running, buckets[j])
+            total = jacobian_add(total, running)
+        result = jacobian_add(result, total)
+    return result
+
+
+def batch_inverse(values, modulus=N):
+    '''Returns the inverses of all the values mod a prime modulus using a
+    single modular exponentiation and 3(n-1) multiplications (Montgomery's
+    trick). The values are either integers or FieldElements of one prime,
+    in which case FieldElements are returned.'''
+    if values and isinstance(values[0], FieldElement):
+        cls, prime = values[0].__class__, values[0].prime
+        inverses = batch_inverse([value.num for value in values], prime)
+        return [cls(inverse, prime) for inverse in inverses]
+    # prefixes[i] is the product of all the values before i
+    prefixes = []
+    product = 1
+    for value in values:
+        prefixes.append(product)
+        product = product * value % modulus
+    if product == 0:
+        raise ZeroDivisionError('cannot invert 0')
+    inverse = pow(product, modulus - 2, modulus)
+    result = [0] * len(values)
+    # walk back, peeling one value off the inverted product at a time
+    for i in range(len(values) - 1, -1, -1):
+        result[i] = inverse * prefixes[i] % modulus
+        inverse = inverse * values[i] % modulus
+    return result
+
+
+def jacobian_to_affine(p):
+    '''Returns the affine (x, y) integers, or (None, None) for infinity'''
+    x, y, z = p
+    if z == 0:
+        return None, None
+    z_inv = pow(z, P - 2, P)
+    z_inv2 = z_inv * z_inv % P
+    return x * z_inv2 % P, y * z_inv2 * z_inv % P
+
+
+def to_affine_batch(points):
+    '''Converts a list of Jacobian points to affine (x, y) integers with a
+    single inversion. The point at infinity becomes (None, None).'''
+    finite = [i for i, p in enumerate(points) if p[2] != 0]
+    z_invs = batch_inverse([points[i][2] for i in finite], P)
+    result = [(None, None)] * len(points)
+    for i, z_inv in zip(finite, z_invs):
+        x, y, _ = points[i]
+        z_inv2 = z_inv * z_inv % P
+        result[i] = (x * z_inv2 % P, y * z_inv2 * z_inv % P)
+    return result
 
 
 class S256Point(Point):
     bits = 256
+    # every point shares the same curve constants
+    a = S256Field(A)
+    b = S256Field(B)
+    # multiples of G come from a table of j*2**(g_window*i)*G that is
+    # built the first time it's needed
+    g_window = 8
+    g_table = None
+    # window sizes for the wNAF digits used by mul_add, G gets a wider
+    # window because its odd multiples are computed only once
+    naf_window = 5
+    g_naf_window = 8
+    g_odd_multiples = None
+    g_lambda_odd_multiples = None
+    # split variable-base scalars with the GLV endomorphism
+    use_glv = True
+    # odd multiples of recently used public keys, keyed by sec, so that
+    # verifying many signatures from the same key only computes them once
+    odd_multiples_cache = LRUCache(maxsize=1024)
+    # set on points that won't be seen again, like the R of a Schnorr
+    # signature, so that their odd multiples stay out of that cache
+    one_off = False
+    # decoded public keys, keyed by sec, since decompressing needs a
+    # square root and the same keys show up again and again
+    sec_cache = LRUCache(maxsize=4096)
+    # the implementation of the curve operations, see set_backend
+    backend = None
+    # multi_mul uses buckets from this many points on, Straus below it
+    pippenger_threshold = 20
+    # a file written by save_tables that the G tables are loaded from
+    # instead of being computed, see load_tables
+    table_file = os.environ.get('PYBTCFORK_ECC_TABLES')
 
     def __init__(self, x, y, a=None, b=None):
-        a, b = S256Field(A), S256Field(B)
+        # the coordinates are kept as plain integers mod P, S256Field
+        # versions are only made when .x or .y is asked for
         if x is None:
-            super().__init__(x=None, y=None, a=a, b=b)
-        elif type(x) == int:
-            super().__init__(x=S256Field(x), y=S256Field(y), a=a, b=b)
-        else:
-            super().__init__(x=x, y=y, a=a, b=b)
+            self.x_num, self.y_num = None, None
+            return
+        if type(x) != int:
+            x, y = x.num, y.num
+        for num in (x, y):
+            if num >= P or num < 0:
+                raise RuntimeError('Num {} not in field range 0 to {}'.format(
+                    num, P-1))
+        # make sure that the elliptic curve equation is satisfied
+        if (y * y - x * x * x - B) % P != 0:
+            raise RuntimeError('({:x}, {:x}) is not on the curve'.format(x, y))
+        self.x_num, self.y_num = x, y
+
+    @classmethod
+    def trusted(cls, x, y):
+        '''Returns the point with integer coordinates x and y without
+        checking that it's on the curve. Only for points that come out of
+        our own arithmetic, anything from outside goes through __init__.'''
+        point = cls.__new__(cls)
+        point.x_num, point.y_num = x, y
+        return point
+
+    @property
+    def x(self):
+        if self.x_num is None:
+            return None
+        return S256Field(self.x_num)
+
+    @property
+    def y(self):
+        if self.y_num is None:
+            return None
+        return S256Field(self.y_num)
+
+    def __eq__(self, other):
+        if isinstance(other, S256Point):
+            return self.x_num == other.x_num and self.y_num == other.y_num
+        return super().__eq__(other)
+
+    def __ne__(self, other):
+        return not self == other
 
     def __repr__(self):
-        if self.x is None:
+        if self.x_num is None:
             return 'Point(infinity)'
         else:
             return 'Point({},{})'.format(self.x, self.y)
 
+    def __add__(self, other):
+        if not isinstance(other, S256Point):
+            return super().__add__(other)
+        return self.backend.add(self, other)
+
     def __rmul__(self, coefficient):
-        # current will undergo binary expansion
-        current = self
-        # result is what we return, starts at 0
-        result = S256Point(None, None)
-        # we double 256 times and add where there is a 1 in the binary
-        # representation of coefficient
-        for i in range(self.bits):
-            if coefficient & 1:
-                result += current
-            current += current
-            # we shift the coefficient to the right
-            coefficient >>= 1
+        return self.backend.mul(coefficient, self)
+
+    @classmethod
+    def load_table_file(cls):
+        '''Loads the tables from table_file if there is one. A file that
+        can't be used is warned about and forgotten, and the tables get
+        built in memory just like when there's no file.'''
+        if not cls.table_file or not os.path.exists(cls.table_file):
+            return
+        try:
+            load_tables(cls.table_file)
+        except (RuntimeError, OSError) as e:
+            warnings.warn('{}, building the ecc tables instead'.format(e),
+                          RuntimeWarning)
+            cls.table_file = None
+
+    @classmethod
+    def get_g_table(cls):
+        if cls.g_table is None:
+            cls.load_table_file()
+        if cls.g_table is None:
+            size = (1 << cls.g_window) - 1
+            points = []
+            base = (G.x_num, G.y_num, 1)
+            for _ in range(0, cls.bits, cls.g_window):
+                # 1*base, 2*base, ... (2**g_window-1)*base
+                row = [base]
+                for _ in range(1, size):
+                    row.append(jacobian_add(row[-1], base))
+                points.extend(row)
+                # the next row starts at 2**g_window times this one
+                base = jacobian_double(row[(size - 1) // 2])
+            # one inversion for the whole table, then row[j] is j*base in
+            # affine coordinates and row[0] is never used
+            points = to_affine_batch(points)
+            cls.g_table = [
+                [None] + points[i:i + size]
+                for i in range(0, len(points), size)]
+        return cls.g_table
+
+    @classmethod
+    def mul_g(cls, coefficient):
+        '''Returns coefficient*G using the precomputed generator table'''
+        x, y = jacobian_to_affine(cls.mul_g_jacobian(coefficient))
+        return cls.trusted(x, y)
+
+    @classmethod
+    def mul_g_jacobian(cls, coefficient):
+        '''Returns coefficient*G in Jacobian coordinates'''
+        coefficient %= N
+        table = cls.get_g_table()
+        mask = (1 << cls.g_window) - 1
+        result = JACOBIAN_INFINITY
+        # one addition per window and no doublings at all
+        for row in table:
+            digit = coefficient & mask
+            if digit:
+                result = jacobian_add_affine(result, row[digit])
+            coefficient >>= cls.g_window
         return result
 
+    @classmethod
+    def get_g_odd_multiples(cls):
+        if cls.g_odd_multiples is None:
+            cls.load_table_file()
+        if cls.g_odd_multiples is None:
+            cls.g_odd_multiples = to_affine_batch(jacobian_odd_multiples(
+                (G.x_num, G.y_num, 1), 1 << (cls.g_naf_window - 2)))
+            cls.g_lambda_odd_multiples = [
+                jacobian_endomorphism(m) for m in cls.g_odd_multiples]
+        return cls.g_odd_multiples
+
+    def odd_multiples(self):
+        '''Returns the odd multiples of this point used for wNAF
+        multiplication, from the cache if this key was seen recently'''
+        key = self.sec()
+        multiples = self.odd_multiples_cache.get(key)
+        if multiples is None:
+            multiples = jacobian_odd_multiples(
+                (self.x_num, self.y_num, 1), 1 << (self.naf_window - 2))
+            self.odd_multiples_cache.put(key, multiples)
+        return multiples
+
+    @classmethod
+    def mul_add(cls, u, v, point):
+        '''Returns u*G + v*point, computed as a single double-scalar
+        multiplication'''
+        x, y = jacobian_to_affine(cls.mul_add_jacobian(u, v, point))
+        return cls.trusted(x, y)
+
+    @classmethod
+    def mul_add_jacobian(cls, u, v, point):
+        '''Same as mul_add, but returns Jacobian coordinates'''
+        g_multiples = cls.get_g_odd_multiples()
+        if cls.use_glv:
+            terms = glv_terms(u % N, g_multiples, cls.g_naf_window,
+                              cls.g_lambda_odd_multiples)
+        else:
+            terms = [(wnaf(u % N, cls.g_naf_window), g_multiples)]
+        if point.x_num is not None:
+            if cls.use_glv:
+                terms += glv_terms(
+                    v % N, point.odd_multiples(), cls.naf_window)
+            else:
+                terms.append(
+                    (wnaf(v % N, cls.naf_window), point.odd_multiples()))
+        return jacobian_straus(terms)
+
+    @classmethod
+    def multi_mul(cls, scalars, points):
+        '''Returns the sum of scalars[i]*points[i]'''
+        if len(scalars) != len(points):
+            raise RuntimeError('{} scalars for {} points'.format(
+                len(scalars), len(points)))
+        return cls.backend.multi_mul(scalars, points)
+
     def sec(self, compressed=True):
         # returns the binary version of the sec format, NOT hex
-        # if compressed, starts with b'\x02' if self.y.num is even,
-        # b'\x03' if self.y is odd then self.x.num
-        # remember, you have to convert self.x.num/self.y.num to binary
-        # (some_integer.to_bytes(32, 'big'))
-        if compressed:
-            if self.y.num % 2 == 0:
-                return b'\x02' + self.x.num.to_bytes(32, 'big')
-            else:
-                return b'\x03' + self.x.num.to_bytes(32, 'big')
-        else:
-            # if non-compressed, starts with b'\x04' followod by self.x
-            # and then self.y
-            return b'\x04' + self.x.num.to_bytes(32, 'big') \
-                + self.y.num.to_bytes(32, 'big')
+        return self.backend.sec(self, compressed)
 
     def h160(self, compressed=True):
         return hash160(self.sec(compressed))
@@ -283,36 +759,52 @@ class S256Point(Point):
         return encode_base58_checksum(prefix + address_bytes)
 
     def verify(self, z, sig):
-        # remember sig.r and sig.s are the main things we're checking
-        # remember 1/s = pow(s, N-2, N)
-        s_inv = pow(sig.s, N-2, N)
-        # u = z / s
-        u = z * s_inv % N
-        # v = r / s
-        v = sig.r * s_inv % N
-        # u*G + v*P should have as the x coordinate, r
-        total = u*G + v*self
-        return total.x.num == sig.r
+        if isinstance(sig, SchnorrSignature):
+            return self.verify_schnorr(z, sig)
+        return self.backend.verify(self, z, sig)
+
+    def verify_schnorr(self, z, sig):
+        return self.backend.verify_schnorr(self, z, sig)
 
     @classmethod
     def parse(self, sec_bin):
         '''returns a Point object from a compressed sec binary (not hex)
         '''
+        return self.backend.parse(sec_bin)
+
+    @classmethod
+    def parse_many(self, sec_bins):
+        '''returns a list of Point objects for a list of sec binaries,
+        decoding each distinct sec only once'''
+        seen = {}
+        result = []
+        for sec_bin in sec_bins:
+            key = bytes(sec_bin)
+            point = seen.get(key)
+            if point is None:
+                point = seen[key] = self.parse(key)
+            result.append(point)
+        return result
+
+    @classmethod
+    def parse_uncached(self, sec_bin):
+        '''returns a Point object from a sec binary without looking in
+        sec_cache'''
         if sec_bin[0] == 4:
             x = int(hexlify(sec_bin[1:33]), 16)
             y = int(hexlify(sec_bin[33:65]), 16)
             return S256Point(x=x, y=y)
         is_even = sec_bin[0] == 2
-        x = S256Field(int(hexlify(sec_bin[1:]), 16))
+        x = int(hexlify(sec_bin[1:]), 16)
         # right side of the equation y^2 = x^3 + 7
-        alpha = x**3 + S256Field(B)
+        alpha = (x * x * x + B) % P
         # solve for left side
-        beta = alpha.sqrt()
-        if beta.num % 2 == 0:
+        beta = sqrt_mod_p(alpha)
+        if beta % 2 == 0:
             even_beta = beta
-            odd_beta = S256Field(P - beta.num)
+            odd_beta = P - beta
         else:
-            even_beta = S256Field(P - beta.num)
+            even_beta = P - beta
             odd_beta = beta
         if is_even:
             return S256Point(x, even_beta)
@@ -325,6 +817,178 @@ G = S256Point(
     0x483ada7726a3c4655da4fbfc0e1108a8fd17b448a68554199c47d08ffb10d4b8)
 
 
+class MappedPoints:
+    '''A read-only list of affine points kept as 64-byte big endian x, y
+    pairs in a buffer. Each point is decoded the first time it's used.
+    Indices before first hold None.'''
+
+    def __init__(self, buf, offset, count, first=0):
+        self.buf = buf
+        self.offset = offset
+        self.first = first
+        self.points = [None] * (first + count)
+
+    def __len__(self):
+        return len(self.points)
+
+    def __getitem__(self, i):
+        point = self.points[i]
+        if point is None and i >= self.first:
+            start = self.offset + (i - self.first) * 64
+            point = self.points[i] = (
+                int.from_bytes(self.buf[start:start + 32], 'big'),
+                int.from_bytes(self.buf[start + 32:start + 64], 'big'),
+            )
+        return point
+
+
+# magic, version, g_window, g_naf_window, naf_window, number of pubkeys
+TABLE_HEADER = struct.Struct('>8sIBBBxI')
+TABLE_MAGIC = b'PYBTCTBL'
+TABLE_VERSION = 1
+
+
+def encode_points(points):
+    return b''.join(
+        x.to_bytes(32, 'big') + y.to_bytes(32, 'big') for x, y in points)
+
+
+def save_tables(filename, points=()):
+    '''Writes the G tables, and the odd multiples of each of points, to
+    filename for load_tables'''
+    g_table = S256Point.get_g_table()
+    g_odd_multiples = S256Point.get_g_odd_multiples()
+    # row[0] is never used
+    parts = [
+        encode_points(row[j] for j in range(1, len(row))) for row in g_table]
+    parts.append(encode_points(g_odd_multiples))
+    for point in points:
+        parts.append(point.sec())
+        multiples = point.odd_multiples()
+        # the ones loaded by load_tables are affine already, only the
+        # Jacobian ones need converting
+        jacobian = [i for i, m in enumerate(multiples) if len(m) == 3]
+        if jacobian:
+            multiples = list(multiples)
+            affine = to_affine_batch([multiples[i] for i in jacobian])
+            for i, m in zip(jacobian, affine):
+                multiples[i] = m
+        parts.append(encode_points(multiples))
+    payload = b''.join(parts)
+    header = TABLE_HEADER.pack(
+        TABLE_MAGIC, TABLE_VERSION, S256Point.g_window,
+        S256Point.g_naf_window, S256Point.naf_window, len(points))
+    # write next to the file and rename, so readers never see half of it
+    tmp = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(header + hashlib.sha256(payload).digest() + payload)
+    os.replace(tmp, filename)
+
+
+def check_tables(filename, buf):
+    '''Raises RuntimeError unless buf holds tables from save_tables that
+    fit the current window sizes. Returns where the tables start.'''
+    if len(buf) < TABLE_HEADER.size + 32:
+        raise RuntimeError('{} is not an ecc table file'.format(filename))
+    magic, version, g_window, g_naf_window, naf_window, num_points = \
+        TABLE_HEADER.unpack_from(buf)
+    if magic != TABLE_MAGIC:
+        raise RuntimeError('{} is not an ecc table file'.format(filename))
+    if version != TABLE_VERSION:
+        raise RuntimeError('{} is version {}, not {}'.format(
+            filename, version, TABLE_VERSION))
+    if (g_window, g_naf_window, naf_window) != (
+            S256Point.g_window, S256Point.g_naf_window, S256Point.naf_window):
+        raise RuntimeError('{} was made with other window sizes'.format(
+            filename))
+    offset = TABLE_HEADER.size + 32
+    rows = -(-S256Point.bits // g_window)
+    size = offset + 64 * (rows * ((1 << g_window) - 1)
+                          + (1 << (g_naf_window - 2))) \
+        + num_points * (33 + 64 * (1 << (naf_window - 2)))
+    if len(buf) != size:
+        raise RuntimeError('{} has the wrong length'.format(filename))
+    checksum = buf[TABLE_HEADER.size:offset]
+    if hashlib.sha256(memoryview(buf)[offset:]).digest() != checksum:
+        raise RuntimeError('{} is corrupted, bad checksum'.format(filename))
+    return offset
+
+
+def load_tables(filename):
+    '''Maps a file written by save_tables into memory and uses its tables
+    from then on. The points are only decoded as they're used.'''
+    with open(filename, 'rb') as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can't be mapped
+            raise RuntimeError('{} is not an ecc table file'.format(filename))
+    try:
+        offset = check_tables(filename, buf)
+    except RuntimeError:
+        buf.close()
+        raise
+    num_points = TABLE_HEADER.unpack_from(buf)[-1]
+    size = (1 << S256Point.g_window) - 1
+    g_table = []
+    for _ in range(0, S256Point.bits, S256Point.g_window):
+        # row[0] is never used, just like in a computed table
+        g_table.append(MappedPoints(buf, offset, size, first=1))
+        offset += size * 64
+    count = 1 << (S256Point.g_naf_window - 2)
+    g_odd_multiples = list(MappedPoints(buf, offset, count))
+    offset += count * 64
+    count = 1 << (S256Point.naf_window - 2)
+    for _ in range(num_points):
+        sec = bytes(buf[offset:offset + 33])
+        S256Point.odd_multiples_cache.put(
+            sec, list(MappedPoints(buf, offset + 33, count)))
+        offset += 33 + count * 64
+    S256Point.g_table = g_table
+    S256Point.g_odd_multiples = g_odd_multiples
+    S256Point.g_lambda_odd_multiples = [
+        jacobian_endomorphism(m) for m in g_odd_multiples]
+
+
+class AddressBatch:
+    '''The secs, hash160s and addresses of a list of points. Each list is
+    computed once and then shared, so asking for the addresses of many
+    prefixes hashes every key only once.'''
+
+    def __init__(self, points):
+        self.points = list(points)
+        self.cache = {}
+
+    def secs(self, compressed=True):
+        key = ('sec', compressed)
+        if key not in self.cache:
+            self.cache[key] = [point.sec(compressed) for point in self.points]
+        return self.cache[key]
+
+    def h160s(self, compressed=True):
+        key = ('h160', compressed)
+        if key not in self.cache:
+            self.cache[key] = [hash160(sec) for sec in self.secs(compressed)]
+        return self.cache[key]
+
+    def segwit_h160s(self):
+        '''hash160s of the p2wpkh redeem scripts (0 <compressed h160>)'''
+        key = ('segwit_h160',)
+        if key not in self.cache:
+            self.cache[key] = [
+                hash160(b'\x00\x14' + h160) for h160 in self.h160s(True)]
+        return self.cache[key]
+
+    def addresses(self, compressed=True, prefix=b'\x00'):
+        # the checksum covers the prefix, so only the hashes can be shared
+        return [encode_base58_checksum(prefix + h160)
+                for h160 in self.h160s(compressed)]
+
+    def segwit_addresses(self, prefix=b'\x05'):
+        return [encode_base58_checksum(prefix + h160)
+                for h160 in self.segwit_h160s()]
+
+
 class Signature:
 
     def __init__(self, r, s):
@@ -335,64 +999,171 @@ class Signature:
         return 'Signature({:x},{:x})'.format(self.r, self.s)
 
     def der(self):
-        rbin = self.r.to_bytes(32, byteorder='big')
-        # remove all null bytes at the beginning
-        rbin = rbin.lstrip(b'\x00')
-        # if rbin has a high bit, add a 00
-        if rbin[0] & 0x80:
-            rbin = b'\x00' + rbin
-        result = bytes([2, len(rbin)]) + rbin
-        sbin = self.s.to_bytes(32, byteorder='big')
-        # remove all null bytes at the beginning
-        sbin = sbin.lstrip(b'\x00')
-        # if sbin has a high bit, add a 00
-        if sbin[0] & 0x80:
-            sbin = b'\x00' + sbin
-        result += bytes([2, len(sbin)]) + sbin
-        return bytes([0x30, len(result)]) + result
+        # DER integers are signed and big endian, so they take one byte
+        # more than the bits need, which gives a leading 00 exactly when
+        # the high bit would otherwise be set
+        rlength = self.r.bit_length() // 8 + 1
+        slength = self.s.bit_length() // 8 + 1
+        return b''.join((
+            bytes((0x30, rlength + slength + 4, 2, rlength)),
+            self.r.to_bytes(rlength, 'big'),
+            bytes((2, slength)),
+            self.s.to_bytes(slength, 'big'),
+        ))
 
     @classmethod
-    def parse(cls, signature_bin):
-        s = BytesIO(signature_bin)
-        compound = s.read(1)[0]
-        if compound != 0x30:
+    def der_many(cls, signatures):
+        '''returns the DER binaries of a list of signatures'''
+        return [sig.der() for sig in signatures]
+
+    @classmethod
+    def parse(cls, signature_bin, strict=False):
+        '''returns a Signature from a DER binary. strict also requires the
+        canonical encoding of BIP66: at most 72 bytes, no negative numbers
+        and no unneeded 00 padding. The lax default accepts those, as
+        older transactions have them.'''
+        # read in place through offsets instead of copying out each field
+        b = memoryview(signature_bin)
+        length = len(b)
+        if length < 8 or b[0] != 0x30:
             raise RuntimeError("Bad Signature")
-        length = s.read(1)[0]
-        if length + 2 != len(signature_bin):
+        if b[1] + 2 != length:
             raise RuntimeError("Bad Signature Length")
-        marker = s.read(1)[0]
-        if marker != 0x02:
+        rlength = b[3]
+        # r has to leave room for the s marker, s length and one byte of s
+        if b[2] != 0x02 or rlength == 0 or rlength + 7 > length:
             raise RuntimeError("Bad Signature")
-        rlength = s.read(1)[0]
-        r = int(hexlify(s.read(rlength)), 16)
-        marker = s.read(1)[0]
-        if marker != 0x02:
+        if b[rlength + 4] != 0x02:
             raise RuntimeError("Bad Signature")
-        slength = s.read(1)[0]
-        s = int(hexlify(s.read(slength)), 16)
-        if len(signature_bin) != 6 + rlength + slength:
+        slength = b[rlength + 5]
+        if slength == 0 or length != 6 + rlength + slength:
             raise RuntimeError("Signature too long")
+        if strict:
+            if length > 72:
+                raise RuntimeError("Bad Signature Length")
+            for start, size in ((4, rlength), (rlength + 6, slength)):
+                # the high bit is the sign, and a 00 is only needed
+                # when the byte after it has the high bit set
+                if b[start] & 0x80 or (
+                        size > 1 and b[start] == 0 and not b[start + 1] & 0x80):
+                    raise RuntimeError("Non-canonical Signature")
+        r = int.from_bytes(b[4:rlength + 4], 'big')
+        s = int.from_bytes(b[rlength + 6:], 'big')
+        return cls(r, s)
+
+    @classmethod
+    def parse_many(cls, signature_bins, strict=False):
+        '''returns a list of Signatures from a list of DER binaries'''
+        return [cls.parse(signature_bin, strict) for signature_bin in signature_bins]
+
+
+class SchnorrSignature:
+    '''The Schnorr signatures of Bitcoin Cash: r is the x coordinate of
+    R = k*G, k picked so that R's y coordinate is a square, and
+    s = k + e*secret where e hashes r, the public key and z. They're
+    serialized as r and s, 32 bytes each, which is how a 64 byte
+    signature is told apart from a DER one.'''
+
+    def __init__(self, r, s):
+        self.r = r
+        self.s = s
+
+    def __repr__(self):
+        return 'SchnorrSignature({:x},{:x})'.format(self.r, self.s)
+
+    def serialize(self):
+        return self.r.to_bytes(32, 'big') + self.s.to_bytes(32, 'big')
+
+    @classmethod
+    def parse(cls, signature_bin):
+        if len(signature_bin) != 64:
+            raise RuntimeError('Bad Signature Length')
+        r = int.from_bytes(signature_bin[:32], 'big')
+        s = int.from_bytes(signature_bin[32:], 'big')
         return cls(r, s)
 
 
+# the additional data RFC6979 mixes into Schnorr nonces, so that they're
+# never the same as the ECDSA ones for the same key and z
+SCHNORR_NONCE_DATA = b'Schnorr+SHA256  '
+
+
+def is_quadratic_residue(num):
+    # Euler's criterion: num**((P-1)/2) is 1 for squares, P-1 otherwise
+    return pow(num, (P - 1) // 2, P) == 1
+
+
+def schnorr_challenge(r, point, z):
+    '''e = sha256(r || compressed sec || z) as a number mod N'''
+    message = r.to_bytes(32, 'big') + point.sec(True) + z.to_bytes(32, 'big')
+    return int.from_bytes(hashlib.sha256(message).digest(), 'big') % N
+
+
+def verify_schnorr_batch(items):
+    '''Verifies a list of (point, z, SchnorrSignature) with a single
+    multi_mul. Returns the indices of the invalid signatures, an empty
+    list if all are valid'''
+    return S256Point.backend.verify_schnorr_batch(items)
+
+
+def verify_batch(items):
+    '''Verifies a list of (point, z, signature) at once. Returns the
+    indices of the invalid signatures, an empty list if all are valid.
+    The Schnorr signatures among them are checked together with
+    verify_schnorr_batch.'''
+    schnorr = [
+        i for i, item in enumerate(items)
+        if isinstance(item[2], SchnorrSignature)]
+    if not schnorr:
+        return S256Point.backend.verify_batch(items)
+    ecdsa = [i for i, item in enumerate(items)
+             if not isinstance(item[2], SchnorrSignature)]
+    failures = [schnorr[i] for i in verify_schnorr_batch(
+        [items[i] for i in schnorr])]
+    if ecdsa:
+        failures.extend(ecdsa[i] for i in S256Point.backend.verify_batch(
+            [items[i] for i in ecdsa]))
+    return sorted(failures)
+
+
+def sign_batch(items):
+    '''Takes a list of (private_key, z) and returns the list of Signatures,
+    the same ones private_key.sign(z) gives'''
+    return S256Point.backend.sign_batch(items)
+
+
+def mul_g_batch(coefficients):
+    '''Returns the list of coefficient*G for each of coefficients'''
+    return S256Point.backend.mul_g_batch(coefficients)
+
+
 class PrivateKey:
 
     def __init__(self, secret, compressed=False, testnet=False):
         self.secret = secret
-        self.point = secret*G
+        self._point = None
         self.compressed = compressed
         self.testnet = testnet
 
+    @property
+    def point(self):
+        # secret*G is only computed the first time it's needed, signing
+        # and wif() don't use it
+        if self._point is None:
+            self._point = self.secret*G
+        return self._point
+
     def hex(self):
         return '{:x}'.format(self.secret).zfill(64)
 
-    def deterministic_k(self, z):
-        # RFC6979, optimized for secp256k1
+    def deterministic_k(self, z, extra_data=b''):
+        # RFC6979, optimized for secp256k1, extra_data is the additional
+        # data of section 3.6
         k = b'\x00' * 32
         v = b'\x01' * 32
         if z > N:
             z -= N
-        z_bytes = z.to_bytes(32, 'big')
+        z_bytes = z.to_bytes(32, 'big') + extra_data
         secret_bytes = self.secret.to_bytes(32, 'big')
         s256 = hashlib.sha256
         k = hmac.new(k, v + b'\x00' + secret_bytes + z_bytes, s256).digest()
@@ -408,19 +1179,10 @@ class PrivateKey:
             v = hmac.new(k, v, s256).digest()
 
     def sign(self, z):
-        # use deterministic signatures
-        k = self.deterministic_k(z)
-        # r is the x coordinate of the resulting point k*G
-        r = (k*G).x.num
-        # remember 1/k = pow(k, N-2, N)
-        k_inv = pow(k, N-2, N)
-        # s = (z+r*secret) / k
-        s = (z + r*self.secret) * k_inv % N
-        if s > N/2:
-            s = N - s
-        # return an instance of Signature:
-        # Signature(r, s)
-        return Signature(r, s)
+        return S256Point.backend.sign(self, z)
+
+    def sign_schnorr(self, z):
+        return S256Point.backend.sign_schnorr(self, z)
 
     def wif(self, prefix=None):
         if prefix is None:
@@ -480,3 +1242,562 @@ class PrivateKey:
             raise RuntimeError('not valid WIF')
         secret = int.from_bytes(secret_bytes, 'big')
         return cls(secret, compressed=compressed, testnet=testnet)
+
+
+def derive_address_chunk(secrets, prefixes):
+    '''The work derive_addresses does in each process, see there'''
+    secrets = [
+        PrivateKey.parse(secret).secret if isinstance(secret, str) else secret
+        for secret in secrets]
+    batch = AddressBatch(mul_g_batch(secrets))
+    columns = [
+        list(zip(batch.addresses(True, p2pkh_prefix),
+                 batch.addresses(False, p2pkh_prefix),
+                 batch.segwit_addresses(p2sh_prefix)))
+        for p2pkh_prefix, p2sh_prefix in prefixes]
+    return [list(row) for row in zip(*columns)]
+
+
+def derive_addresses(secrets, prefixes=((b'\x00', b'\x05'),),
+                     workers=None, chunk_size=1000):
+    '''Yields the addresses of each of secrets, which are integers or WIF
+    strings, in order. For each secret that's a list with a (compressed
+    p2pkh, uncompressed p2pkh, p2sh-p2wpkh) tuple of addresses for every
+    (p2pkh prefix, p2sh prefix) in prefixes, for instance one per fork in
+    tx.py. The secrets are split in chunks of chunk_size over workers
+    processes (one per cpu by default). Each process builds the G table
+    once, unless PYBTCFORK_ECC_TABLES points at a table file.'''
+    return map_chunks(
+        derive_address_chunk, secrets, chunk_size, workers, (prefixes,))
+
+
+class ReferenceBackend:
+    '''The curve operations done the textbook way: affine points of
+    S256Field coordinates, the formulas in Point.__add__ and double-and-add.
+    Slow, but every step can be checked by hand, which makes it the one
+    the other backends are held to.'''
+    name = 'reference'
+
+    def add(self, p, q):
+        return Point.__add__(p, q)
+
+    def mul(self, coefficient, point):
+        # every point on secp256k1 has order N
+        coefficient %= N
+        current = point
+        # result is what we return, starts at 0
+        result = S256Point(None, None)
+        # we double and add where there is a 1 in the binary
+        # representation of coefficient
+        while coefficient:
+            if coefficient & 1:
+                result = self.add(result, current)
+            current = self.add(current, current)
+            # we shift the coefficient to the right
+            coefficient >>= 1
+        return result
+
+    def mul_g_batch(self, coefficients):
+        return [self.mul(coefficient, G) for coefficient in coefficients]
+
+    def multi_mul(self, scalars, points):
+        result = S256Point(None, None)
+        for scalar, point in zip(scalars, points):
+            result = self.add(result, self.mul(scalar, point))
+        return result
+
+    def sign(self, private_key, z):
+        # use deterministic signatures
+        k = private_key.deterministic_k(z)
+        # r is the x coordinate of the resulting point k*G
+        r = self.mul(k, G).x.num
+        # remember 1/k = pow(k, N-2, N)
+        k_inv = pow(k, N-2, N)
+        # s = (z+r*secret) / k
+        s = (z + r*private_key.secret) * k_inv % N
+        if s > N/2:
+            s = N - s
+        return Signature(r, s)
+
+    def verify(self, point, z, sig):
+        # r and s are numbers mod N, anything else isn't a signature
+        if not 0 < sig.r < N or not 0 < sig.s < N:
+            return False
+        # remember 1/s = pow(s, N-2, N)
+        s_inv = pow(sig.s, N-2, N)
+        # u = z / s
+        u = z * s_inv % N
+        # v = r / s
+        v = sig.r * s_inv % N
+        # u*G + v*P should have as the x coordinate, r
+        total = self.add(self.mul(u, G), self.mul(v, point))
+        if total.x is None:
+            return False
+        return total.x.num == sig.r
+
+    def sign_batch(self, items):
+        return [self.sign(private_key, z) for private_key, z in items]
+
+    def verify_batch(self, items):
+        return [
+            i for i, (point, z, sig) in enumerate(items)
+            if not self.verify(point, z, sig)
+        ]
+
+    def sign_schnorr(self, private_key, z):
+        k = private_key.deterministic_k(z, SCHNORR_NONCE_DATA)
+        r_point = self.mul(k, G)
+        # R has to have a square y coordinate, and -R has one if R doesn't
+        if not is_quadratic_residue(r_point.y_num):
+            k = N - k
+        r = r_point.x_num
+        e = schnorr_challenge(r, private_key.point, z)
+        return SchnorrSignature(r, (k + e * private_key.secret) % N)
+
+    def verify_schnorr(self, point, z, sig):
+        if point.x_num is None or not 0 <= sig.r < P or not 0 <= sig.s < N:
+            return False
+        e = schnorr_challenge(sig.r, point, z)
+        # s*G - e*P should be R: x coordinate r, square y coordinate
+        total = self.multi_mul([sig.s, -e % N], [G, point])
+        if total.x_num is None:
+            return False
+        return total.x_num == sig.r and is_quadratic_residue(total.y_num)
+
+    def verify_schnorr_batch(self, items):
+        failures = []
+        pending = []
+        # each signature says s*G = R + e*P. Adding those up, each times a
+        # random a so that invalid ones can't cancel out, gives
+        # (sum a*s)*G - sum a*e*P - sum a*R = 0
+        g_scalar = 0
+        scalars = []
+        points = []
+        for i, (point, z, sig) in enumerate(items):
+            if point.x_num is None or not 0 <= sig.r < P or not 0 <= sig.s < N:
+                failures.append(i)
+                continue
+            # R is the point with x coordinate r and a square y, and the
+            # square root of a square is itself a square on this curve
+            alpha = (pow(sig.r, 3, P) + B) % P
+            y = sqrt_mod_p(alpha)
+            if y * y % P != alpha:
+                failures.append(i)
+                continue
+            # the first weight can be 1, the others are 128 random bits
+            if pending:
+                a = int.from_bytes(os.urandom(16), 'big')
+            else:
+                a = 1
+            pending.append(i)
+            e = schnorr_challenge(sig.r, point, z)
+            g_scalar += a * sig.s
+            r_point = S256Point.trusted(sig.r, y)
+            r_point.one_off = True
+            scalars.extend((-a * e % N, -a % N))
+            points.extend((point, r_point))
+        if not pending:
+            return failures
+        scalars.append(g_scalar % N)
+        points.append(G)
+        if self.multi_mul(scalars, points).x_num is None:
+            return failures
+        # something is wrong, check them one by one to find out what
+        for i in pending:
+            point, z, sig = items[i]
+            if not self.verify_schnorr(point, z, sig):
+                failures.append(i)
+        return sorted(failures)
+
+    def parse(self, sec_bin):
+        if sec_bin[0] == 4:
+            x = int.from_bytes(sec_bin[1:33], 'big')
+            y = int.from_bytes(sec_bin[33:65], 'big')
+            return S256Point(x=x, y=y)
+        is_even = sec_bin[0] == 2
+        x = S256Field(int.from_bytes(sec_bin[1:], 'big'))
+        # right side of the equation y^2 = x^3 + 7
+        alpha = x**3 + S256Field(B)
+        # solve for left side, P = 3 mod 4 so this is a square root
+        beta = alpha**((P + 1) // 4)
+        if beta.num % 2 == 0:
+            even_beta = beta
+            odd_beta = S256Field(P - beta.num)
+        else:
+            even_beta = S256Field(P - beta.num)
+            odd_beta = beta
+        if is_even:
+            return S256Point(x, even_beta)
+        else:
+            return S256Point(x, odd_beta)
+
+    def sec(self, point, compressed=True):
+        # if compressed, starts with b'\x02' if y is even, b'\x03' if y is
+        # odd, then x
+        x = point.x.num.to_bytes(32, 'big')
+        if compressed:
+            if point.y.num % 2 == 0:
+                return b'\x02' + x
+            else:
+                return b'\x03' + x
+        else:
+            # if non-compressed, starts with b'\x04' followed by x and y
+            return b'\x04' + x + point.y.num.to_bytes(32, 'big')
+
+
+class FastBackend(ReferenceBackend):
+    '''Integer Jacobian coordinates, the precomputed G table, wNAF with
+    Straus interleaving, the GLV endomorphism and batched inversions,
+    using the tables and caches kept on S256Point'''
+    name = 'fast'
+
+    def add(self, p, q):
+        if p.x_num is None:
+            return q
+        if q.x_num is None:
+            return p
+        x, y = jacobian_to_affine(jacobian_add_affine(
+            (p.x_num, p.y_num, 1), (q.x_num, q.y_num)))
+        return S256Point.trusted(x, y)
+
+    def mul(self, coefficient, point):
+        if point.x_num is None:
+            return point
+        if point == G:
+            return S256Point.mul_g(coefficient)
+        # every point on secp256k1 has order N
+        coefficient %= N
+        if S256Point.use_glv:
+            multiples = jacobian_odd_multiples(
+                (point.x_num, point.y_num, 1), 1 << (S256Point.naf_window - 2))
+            result = jacobian_straus(
+                glv_terms(coefficient, multiples, S256Point.naf_window))
+            x, y = jacobian_to_affine(result)
+            return S256Point.trusted(x, y)
+        # current will undergo binary expansion, in Jacobian coordinates
+        current = (point.x_num, point.y_num, 1)
+        # result is what we return, starts at 0
+        result = JACOBIAN_INFINITY
+        # we double and add where there is a 1 in the binary
+        # representation of coefficient
+        while coefficient:
+            if coefficient & 1:
+                result = jacobian_add(result, current)
+            current = jacobian_double(current)
+            # we shift the coefficient to the right
+            coefficient >>= 1
+        # one inversion to get back to affine coordinates
+        x, y = jacobian_to_affine(result)
+        return S256Point.trusted(x, y)
+
+    def mul_g_batch(self, coefficients):
+        # one inversion to bring all of them back to affine coordinates
+        points = to_affine_batch(
+            [S256Point.mul_g_jacobian(coefficient) for coefficient in coefficients])
+        return [S256Point.trusted(x, y) for x, y in points]
+
+    def multi_mul(self, scalars, points):
+        pairs = [
+            (scalar % N, point) for scalar, point in zip(scalars, points)
+            if point.x_num is not None and scalar % N]
+        if len(pairs) < S256Point.pippenger_threshold:
+            # few points: wNAF tables for each and one chain of doublings
+            terms = []
+            for scalar, point in pairs:
+                if point == G:
+                    # the wider precomputed tables, like mul_add
+                    terms += glv_terms(
+                        scalar, S256Point.get_g_odd_multiples(),
+                        S256Point.g_naf_window,
+                        S256Point.g_lambda_odd_multiples)
+                elif point.one_off:
+                    multiples = jacobian_odd_multiples(
+                        (point.x_num, point.y_num, 1),
+                        1 << (S256Point.naf_window - 2))
+                    terms += glv_terms(scalar, multiples, S256Point.naf_window)
+                else:
+                    terms += glv_terms(
+                        scalar, point.odd_multiples(), S256Point.naf_window)
+            result = jacobian_straus(terms)
+        else:
+            # many points: split each scalar with the endomorphism, which
+            # gives twice the terms at half the bits, and use buckets
+            terms = []
+            for scalar, point in pairs:
+                p = (point.x_num, point.y_num)
+                for part, q in zip(glv_split(scalar),
+                                   (p, jacobian_endomorphism(p))):
+                    if part < 0:
+                        terms.append((-part, jacobian_negate(q)))
+                    elif part:
+                        terms.append((part, q))
+            result = jacobian_pippenger(terms, pippenger_window(len(terms)))
+        x, y = jacobian_to_affine(result)
+        return S256Point.trusted(x, y)
+
+    def sign(self, private_key, z):
+        # use deterministic signatures
+        k = private_key.deterministic_k(z)
+        # r is the x coordinate of the resulting point k*G
+        r = S256Point.mul_g(k).x_num
+        # remember 1/k = pow(k, N-2, N)
+        k_inv = pow(k, N-2, N)
+        # s = (z+r*secret) / k
+        s = (z + r*private_key.secret) * k_inv % N
+        if s > N/2:
+            s = N - s
+        return Signature(r, s)
+
+    def verify(self, point, z, sig):
+        # r and s are numbers mod N, anything else isn't a signature
+        if not 0 < sig.r < N or not 0 < sig.s < N:
+            return False
+        # remember 1/s = pow(s, N-2, N)
+        s_inv = pow(sig.s, N-2, N)
+        # u = z / s
+        u = z * s_inv % N
+        # v = r / s
+        v = sig.r * s_inv % N
+        # u*G + v*P should have as the x coordinate, r
+        total = S256Point.mul_add(u, v, point)
+        if total.x_num is None:
+            return False
+        return total.x_num == sig.r
+
+    def sign_batch(self, items):
+        ks = [private_key.deterministic_k(z) for private_key, z in items]
+        # r is the x coordinate of k*G, one inversion mod P finds all of them
+        points = to_affine_batch([S256Point.mul_g_jacobian(k) for k in ks])
+        # and one inversion mod N finds all the 1/k
+        k_invs = batch_inverse(ks, N)
+        signatures = []
+        for (private_key, z), (r, _), k_inv in zip(items, points, k_invs):
+            # s = (z+r*secret) / k
+            s = (z + r*private_key.secret) * k_inv % N
+            if s > N/2:
+                s = N - s
+            signatures.append(Signature(r, s))
+        return signatures
+
+    def verify_batch(self, items):
+        failures = []
+        pending = []
+        for i, (point, z, sig) in enumerate(items):
+            if point.x_num is None or not 0 < sig.r < N or not 0 < sig.s < N:
+                failures.append(i)
+            else:
+                pending.append(i)
+        # every 1/s with a single inversion
+        s_invs = batch_inverse([items[i][2].s for i in pending], N)
+        for i, s_inv in zip(pending, s_invs):
+            point, z, sig = items[i]
+            u = z * s_inv % N
+            v = sig.r * s_inv % N
+            x, _, jz = S256Point.mul_add_jacobian(u, v, point)
+            # the affine x is x/jz**2, so compare x with r*jz**2 and skip
+            # converting back to affine altogether
+            if jz == 0 or x != sig.r * jz * jz % P:
+                failures.append(i)
+        return sorted(failures)
+
+    def parse(self, sec_bin):
+        # decompressing takes a square root, so look in the cache first
+        key = bytes(sec_bin)
+        point = S256Point.sec_cache.get(key)
+        if point is None:
+            point = S256Point.parse_uncached(key)
+            S256Point.sec_cache.put(key, point)
+        return point
+
+    def sec(self, point, compressed=True):
+        if compressed:
+            if point.y_num % 2 == 0:
+                return b'\x02' + point.x_num.to_bytes(32, 'big')
+            else:
+                return b'\x03' + point.x_num.to_bytes(32, 'big')
+        else:
+            return b'\x04' + point.x_num.to_bytes(32, 'big') \
+                + point.y_num.to_bytes(32, 'big')
+
+
+BACKENDS = {
+    'reference': ReferenceBackend(),
+    'fast': FastBackend(),
+}
+
+
+def set_backend(name):
+    '''Selects the implementation of the curve operations behind
+    S256Point, PrivateKey.sign, sign_batch and verify_batch, and their
+    Schnorr counterparts, by its name in BACKENDS. Returns the name of the
+    one it replaces.'''
+    if name not in BACKENDS:
+        raise RuntimeError('unknown ecc backend: {}'.format(name))
+    previous = S256Point.backend
+    S256Point.backend = BACKENDS[name]
+    if previous is not None:
+        return previous.name
+
+
+class CountingBackend:
+    '''Wraps a backend for OperationCounter: counts the signatures,
+    verifications and scalar multiplications asked of it and times the
+    calls'''
+
+    # the operation each backend method counts as, and whether its first
+    # argument is a list with one operation per item
+    operations = {
+        'mul': ('mul', False),
+        'mul_g_batch': ('mul', True),
+        'multi_mul': ('mul', True),
+        'sign': ('sign', False),
+        'sign_batch': ('sign', True),
+        'verify': ('verify', False),
+        'verify_batch': ('verify', True),
+        'sign_schnorr': ('sign', False),
+        'verify_schnorr': ('verify', False),
+        'verify_schnorr_batch': ('verify', True),
+    }
+
+    def __init__(self, backend, counter):
+        self.backend = backend
+        self.counter = counter
+        self.name = backend.name
+
+    def __getattr__(self, attribute):
+        method = getattr(self.backend, attribute)
+        operation, batch = self.operations.get(attribute, (None, False))
+        counter = self.counter
+
+        def timed(*args):
+            if operation is not None:
+                counter.counts[operation] += len(args[0]) if batch else 1
+            # the backend calling itself doesn't go through here, but an
+            # S256Point operation inside one (secret*G) would: only the
+            # outermost call is timed so nothing is counted twice
+            counter.depth += 1
+            start = time.perf_counter()
+            try:
+                return method(*args)
+            finally:
+                counter.depth -= 1
+                if counter.depth == 0:
+                    elapsed = time.perf_counter() - start
+                    counter.seconds[attribute] = counter.seconds.get(attribute, 0) + elapsed
+        return timed
+
+
+class OperationCounter:
+    '''Counts the point additions, doublings, field inversions, scalar
+    multiplications, signatures and verifications done while it's active,
+    and the wall time spent in the backend. Use it as a context manager:
+
+        with OperationCounter() as counter:
+            tx.sign_inputs(signers)
+        print(counter.report())
+
+    or set PYBTCFORK_ECC_STATS=1 to count the whole run and print the
+    totals when it exits. Nothing is wrapped while no counter is active,
+    so it costs nothing when off. Only this process is counted, not the
+    workers of derive_addresses.'''
+
+    operations = ('add', 'double', 'inverse', 'mul', 'sign', 'verify')
+    active = None
+
+    def __init__(self):
+        self.counts = {operation: 0 for operation in self.operations}
+        self.seconds = {}
+        self.depth = 0
+        self.saved = {}
+
+    def count(self, operation, function):
+        counts = self.counts
+
+        def counted(*args):
+            counts[operation] += 1
+            return function(*args)
+        return counted
+
+    def start(self):
+        if OperationCounter.active is not None:
+            raise RuntimeError('already counting ecc operations')
+        OperationCounter.active = self
+        module = sys.modules[__name__]
+        self.saved = {
+            name: getattr(module, name) for name in (
+                'jacobian_add', 'jacobian_add_affine', 'jacobian_double',
+                'jacobian_to_affine', 'batch_inverse')}
+        self.saved['Point.__add__'] = Point.__add__
+        self.saved['FieldElement.__truediv__'] = FieldElement.__truediv__
+        self.saved['backend'] = S256Point.backend
+        # every call inside this module looks these names up as it goes,
+        # so rebinding them is enough to count the calls
+        module.jacobian_add = self.count('add', self.saved['jacobian_add'])
+        module.jacobian_add_affine = self.count(
+            'add', self.saved['jacobian_add_affine'])
+        module.jacobian_double = self.count('double', self.saved['jacobian_double'])
+        module.jacobian_to_affine = self.count(
+            'inverse', self.saved['jacobian_to_affine'])
+
+        def counted_batch_inverse(values, modulus=N):
+            # a list of FieldElements comes back through here with their
+            # prime, and inverses mod N aren't field inversions
+            if modulus == P:
+                self.counts['inverse'] += 1
+            return self.saved['batch_inverse'](values, modulus)
+        module.batch_inverse = counted_batch_inverse
+
+        # the reference backend works on Points and FieldElements
+        def counted_add(p, q):
+            self.counts['double' if p == q else 'add'] += 1
+            return self.saved['Point.__add__'](p, q)
+        Point.__add__ = counted_add
+        FieldElement.__truediv__ = self.count(
+            'inverse', self.saved['FieldElement.__truediv__'])
+        S256Point.backend = CountingBackend(S256Point.backend, self)
+
+    def stop(self):
+        if OperationCounter.active is not self:
+            raise RuntimeError('not counting ecc operations')
+        module = sys.modules[__name__]
+        for name in ('jacobian_add', 'jacobian_add_affine', 'jacobian_double',
+                     'jacobian_to_affine', 'batch_inverse'):
+            setattr(module, name, self.saved[name])
+        Point.__add__ = self.saved['Point.__add__']
+        FieldElement.__truediv__ = self.saved['FieldElement.__truediv__']
+        # unless set_backend picked another one in the meantime
+        if isinstance(S256Point.backend, CountingBackend):
+            S256Point.backend = self.saved['backend']
+        OperationCounter.active = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def total_seconds(self):
+        return sum(self.seconds.values())
+
+    def report(self):
+        lines = ['{:8} {:>10}'.format(operation, self.counts[operation])
+                 for operation in self.operations]
+        for name in sorted(self.seconds):
+            lines.append('{:12} {:>10.3f}s'.format(name, self.seconds[name]))
+        lines.append('{:12} {:>10.3f}s'.format('total', self.total_seconds()))
+        return '\n'.join(lines)
+
+
+def print_operation_counts(counter):
+    counter.stop()
+    print(counter.report(), file=sys.stderr)
+
+
+# the fast backend unless the environment asks for another one
+set_backend(os.environ.get('PYBTCFORK_ECC_BACKEND', 'fast'))
+
+if os.environ.get('PYBTCFORK_ECC_STATS'):
+    counter = OperationCounter()
+    counter.start()
+    atexit.register(print_operation_counts, counter)
@@ -1,15 +1,43 @@
 from binascii import unhexlify
 from random import randint
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 
+import ecc
+import os
+
 from ecc import (
+    AddressBatch,
+    BACKENDS,
     FieldElement,
     Point,
     PrivateKey,
+    S256Field,
     S256Point,
+    SchnorrSignature,
     Signature,
     G,
     N,
+    P,
+    BETA,
+    LAMBDA,
+    OperationCounter,
+    batch_inverse,
+    derive_addresses,
+    glv_split,
+    jacobian_double,
+    jacobian_pippenger,
+    jacobian_to_affine,
+    load_tables,
+    mul_g_batch,
+    save_tables,
+    set_backend,
+    sign_batch,
+    sqrt_mod_p,
+    to_affine_batch,
+    verify_batch,
+    verify_schnorr_batch,
+    wnaf,
 )
 
 
@@ -219,6 +247,126 @@ class S256Test(TestCase):
             # check that the secret*G is the same as the point
             self.assertEqual(secret*G, point)
 
+    def test_jacobian(self):
+        # compare against double-and-add with the affine Point.__add__
+        for secret in (1, 2, 3, 1485, 2**128, N-1, randint(1, N-1)):
+            current = G
+            want = S256Point(None, None)
+            coefficient = secret
+            while coefficient:
+                if coefficient & 1:
+                    want = Point.__add__(want, current)
+                current = Point.__add__(current, current)
+                coefficient >>= 1
+            self.assertEqual(secret*G, want)
+        self.assertIsNone((N*G).x)
+        self.assertEqual((N+5)*G, 5*G)
+
+    def test_mul_g(self):
+        # b*G is not G, so multiplying it by a takes the generic path
+        for a, b in ((1, 2), (255, 3), (256, 5), (2**255, 7), (N-1, 11)):
+            self.assertEqual(S256Point.mul_g(a*b), a*(b*G))
+        self.assertIsNone(S256Point.mul_g(N).x)
+
+    def test_wnaf(self):
+        for k in (1, 2, 15, 16, 2**255, N-1, randint(1, N-1)):
+            for width in (2, 5, 8):
+                digits = wnaf(k, width)
+                self.assertEqual(sum(d << i for i, d in enumerate(digits)), k)
+                for i, d in enumerate(digits):
+                    if d:
+                        self.assertEqual(d % 2, 1)
+                        self.assertTrue(abs(d) < 2**(width-1))
+                        self.assertFalse(any(digits[i+1:i+width]))
+
+    def test_mul_add(self):
+        point = 12345*G
+        tests = (
+            (0, 0),
+            (1, 0),
+            (0, 1),
+            (N-1, 12345),
+            (12345, N-1),
+            (randint(1, N-1), randint(1, N-1)),
+            (randint(1, N-1), randint(1, N-1)),
+        )
+        for u, v in tests:
+            self.assertEqual(S256Point.mul_add(u, v, point), u*G + v*point)
+        self.assertEqual(S256Point.mul_add(7, 3, G), 10*G)
+        self.assertEqual(S256Point.mul_add(5, 9, S256Point(None, None)), 5*G)
+
+    def test_multi_mul(self):
+        # the Straus and bucket paths belong to the fast backend
+        previous = set_backend('fast')
+        try:
+            points = [randint(1, N-1)*G for _ in range(25)]
+            scalars = [randint(0, N-1) for _ in range(25)]
+            # edge cases: a zero scalar, a point and its negation, a repeated
+            # point, the point at infinity and a scalar over N
+            points[1:5] = [points[0], (N-1)*points[0], points[0], S256Point(None, None)]
+            scalars[1:5] = [0, 5, 7, 11]
+            scalars[5] += N
+            want = S256Point(None, None)
+            for n in range(len(points) + 1):
+                # Straus below S256Point.pippenger_threshold, buckets above
+                self.assertEqual(S256Point.multi_mul(scalars[:n], points[:n]), want)
+                if n < len(points):
+                    want = want + scalars[n]*points[n]
+            with self.assertRaises(RuntimeError):
+                S256Point.multi_mul([1, 2], [G])
+            terms = [(k, (p.x_num, p.y_num)) for k, p in zip((1, 2**129, 3), (G, G, 5*G))]
+            want = (2**129 + 16)*G
+            for width in (2, 5, 9):
+                x, y = jacobian_to_affine(jacobian_pippenger(terms, width))
+                self.assertEqual(S256Point(x, y), want)
+        finally:
+            set_backend(previous)
+
+    def test_glv(self):
+        for k in (1, 2, LAMBDA, N-1, N//2, 2**128, randint(1, N-1)):
+            k1, k2 = glv_split(k)
+            self.assertEqual((k1 + k2*LAMBDA) % N, k)
+            self.assertTrue(abs(k1) < 2**128 and abs(k2) < 2**128)
+        point = 8675309*G
+        want = S256Point(BETA*point.x.num % P, point.y.num)
+        self.assertEqual(LAMBDA*point, want)
+        # compare against the plain double-and-add ladder
+        tests = (1, 3, N-1, LAMBDA, randint(1, N-1), randint(1, N-1))
+        try:
+            for k in tests:
+                S256Point.use_glv = True
+                glv = k*point
+                glv_verify = S256Point.mul_add(k, k+1, point)
+                S256Point.use_glv = False
+                self.assertEqual(glv, k*point)
+                self.assertEqual(glv_verify, S256Point.mul_add(k, k+1, point))
+        finally:
+            S256Point.use_glv = True
+
+    def test_coordinates(self):
+        point = 7*G
+        x = 0x5cbdf0646e5db4eaa398f365f2ea7a0e3d419b7e0330e39ce92bddedcac4f9bc
+        self.assertEqual(point.x, S256Field(x))
+        self.assertEqual(point.x_num, x)
+        self.assertEqual(S256Point(point.x, point.y), point)
+        self.assertNotEqual(point, G)
+        self.assertIsNone(S256Point(None, None).x)
+        with self.assertRaises(RuntimeError):
+            S256Point(x, point.y_num + 1)
+        # adding S256Points matches the affine formulas in Point
+        for a, b in ((2, 3), (5, 5), (4, N-4), (1, 0)):
+            self.assertEqual(a*G + b*G, Point.__add__(a*G, b*G))
+
+    def test_trusted(self):
+        # no curve check, so only for results of our own arithmetic
+        point = S256Point.trusted(1, 1)
+        self.assertEqual(point.x_num, 1)
+        self.assertIs(point.a, G.a)
+        with self.assertRaises(RuntimeError):
+            S256Point(1, 1)
+        with self.assertRaises(RuntimeError):
+            S256Point.parse(b'\x04' + (1).to_bytes(32, 'big') * 2)
+
     def test_sec(self):
         coefficient = 999**3
         uncompressed = '049d5ca49670cbe4c3bfa84c96a8c87df086c6ea6a24ba6b809c9de234496808d56fa15cc7f3d38cda98dee2419f415b7513dde1301f8643cd9245aea7f3f911f9'
@@ -278,12 +426,430 @@ class S256Test(TestCase):
         s = 0xc7207fee197d27c618aea621406f6bf5ef6fca38681d82b2f06fddbdce6feab6
         self.assertTrue(point.verify(z, Signature(r, s)))
 
+    def test_verify_cache(self):
+        # the cache belongs to the fast backend
+        previous = set_backend('fast')
+        try:
+            cache = S256Point.odd_multiples_cache
+            pk = PrivateKey(8675309)
+            sigs = [(z, pk.sign(z)) for z in (1, 2, 3)]
+            cache.clear()
+            for z, sig in sigs:
+                self.assertTrue(pk.point.verify(z, sig))
+            self.assertEqual((cache.hits, cache.misses), (2, 1))
+            # the same key parsed from sec is a hit too
+            point = S256Point.parse(pk.point.sec(compressed=False))
+            self.assertFalse(point.verify(4, sigs[0][1]))
+            self.assertEqual((cache.hits, cache.misses), (3, 1))
+        finally:
+            set_backend(previous)
+
     def test_parse(self):
         sec = unhexlify('0349fc4e631e3624a545de3f89f5d8684c7b8138bd94bdd531d2e213bf016b278a')
         point = S256Point.parse(sec)
         want = 0xa56c896489c71dfc65701ce25050f542f336893fb8cd15f4e8e5c124dbf58e47
         self.assertEqual(point.y.num, want)
 
+    def test_tables(self):
+        saved = (S256Point.g_table, S256Point.g_odd_multiples,
+                 S256Point.g_lambda_odd_multiples, S256Point.table_file)
+        g_table = S256Point.get_g_table()
+        g_odd_multiples = S256Point.get_g_odd_multiples()
+        point = PrivateKey(8675309).point
+        sig = PrivateKey(8675309).sign(1)
+        # the pubkey tables go in the fast backend's cache
+        previous = set_backend('fast')
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'tables')
+            try:
+                save_tables(filename, [point])
+                # the file is found on first use instead of building tables
+                S256Point.g_table = S256Point.g_odd_multiples = None
+                S256Point.odd_multiples_cache.clear()
+                S256Point.table_file = filename
+                self.assertEqual(S256Point.mul_g(12345), 12345*G)
+                self.assertEqual(len(S256Point.g_table), len(g_table))
+                for row, want in zip(S256Point.g_table, g_table):
+                    self.assertEqual(list(row), list(want))
+                self.assertEqual(S256Point.g_odd_multiples, g_odd_multiples)
+                self.assertTrue(point.verify(1, sig))
+                cache = S256Point.odd_multiples_cache
+                self.assertEqual((cache.hits, cache.misses), (1, 0))
+                # saving tables that were loaded writes the same file
+                again = os.path.join(tmp, 'again')
+                save_tables(again, [point])
+                with open(filename, 'rb') as f, open(again, 'rb') as g:
+                    self.assertEqual(f.read(), g.read())
+            finally:
+                (S256Point.g_table, S256Point.g_odd_multiples,
+                 S256Point.g_lambda_odd_multiples, S256Point.table_file) = saved
+                S256Point.odd_multiples_cache.clear()
+                set_backend(previous)
+            # flip one bit and the checksum catches it
+            with open(filename, 'rb') as f:
+                data = bytearray(f.read())
+            data[1000] ^= 1
+            with open(filename, 'wb') as f:
+                f.write(data)
+            with self.assertRaises(RuntimeError):
+                load_tables(filename)
+            with open(filename, 'wb') as f:
+                f.write(data[:-1])
+            with self.assertRaises(RuntimeError):
+                load_tables(filename)
+            # a bad table file only gets a warning, and the tables are built
+            want = PrivateKey(12345).point
+            try:
+                S256Point.g_table = S256Point.g_odd_multiples = None
+                S256Point.table_file = filename
+                with self.assertWarns(RuntimeWarning):
+                    self.assertEqual(S256Point.mul_g(12345), want)
+                self.assertIsNone(S256Point.table_file)
+                self.assertTrue(point.verify(1, sig))
+            finally:
+                (S256Point.g_table, S256Point.g_odd_multiples,
+                 S256Point.g_lambda_odd_multiples, S256Point.table_file) = saved
+
+    def test_sqrt(self):
+        for a in (0, 1, 2, 7, P-1, randint(1, P-1)):
+            self.assertEqual(sqrt_mod_p(a), pow(a, (P+1)//4, P))
+        y = S256Field(randint(1, P-1))
+        self.assertIn((y*y).sqrt(), (y, S256Field(P - y.num)))
+
+    def test_parse_many(self):
+        # the cache belongs to the fast backend
+        previous = set_backend('fast')
+        try:
+            cache = S256Point.sec_cache
+            points = [PrivateKey(secret).point for secret in (1, 2, 3)]
+            secs = [p.sec() for p in points] + [points[0].sec(compressed=False)]
+            cache.clear()
+            parsed = S256Point.parse_many(secs + secs[:2])
+            self.assertEqual(parsed, points + points[:1] + points[:2])
+            self.assertEqual((cache.hits, cache.misses), (0, 4))
+            # a second pass decodes nothing
+            self.assertEqual(S256Point.parse_many(secs), parsed[:4])
+            self.assertEqual((cache.hits, cache.misses), (4, 4))
+            self.assertIs(S256Point.parse(bytearray(secs[1])), parsed[1])
+        finally:
+            set_backend(previous)
+
+
+class BatchTest(TestCase):
+
+    def test_batch_inverse(self):
+        values = [1, 2, 3, N-1, randint(1, N-1)]
+        for value, inverse in zip(values, batch_inverse(values, N)):
+            self.assertEqual(value * inverse % N, 1)
+        self.assertEqual(batch_inverse([], N), [])
+        elements = [FieldElement(n, 31) for n in range(1, 31)]
+        for element, inverse in zip(elements, batch_inverse(elements)):
+            self.assertEqual(element * inverse, FieldElement(1, 31))
+        with self.assertRaises(ZeroDivisionError):
+            batch_inverse([3, 0, 5], N)
+
+    def test_to_affine_batch(self):
+        points = [(G.x.num, G.y.num, 1)]
+        for _ in range(5):
+            points.append(jacobian_double(points[-1]))
+        points.append((0, 1, 0))
+        want = [jacobian_to_affine(p) for p in points]
+        self.assertEqual(to_affine_batch(points), want)
+        self.assertEqual(want[-1], (None, None))
+        self.assertEqual(S256Point(*want[3]), 8*G)
+
+    def test_verify_batch(self):
+        pk1 = PrivateKey(8675309)
+        pk2 = PrivateKey(randint(1, N-1))
+        items = []
+        for z in range(1, 6):
+            items.append((pk1.point, z, pk1.sign(z)))
+            items.append((pk2.point, z, pk2.sign(z)))
+        self.assertEqual(verify_batch(items), [])
+        self.assertEqual(verify_batch([]), [])
+        sig = pk1.sign(100)
+        bad = list(items)
+        bad[3] = (pk1.point, 2, bad[3][2])
+        bad[4] = (pk1.point, 3, Signature(sig.r, 0))
+        bad[6] = (pk1.point, 4, Signature(0, sig.s))
+        bad[8] = (S256Point(None, None), 5, sig)
+        self.assertEqual(verify_batch(bad), [3, 4, 6, 8])
+        for i, (point, z, sig) in enumerate(items):
+            self.assertTrue(point.verify(z, sig))
+        self.assertFalse(bad[3][0].verify(bad[3][1], bad[3][2]))
+
+    def test_sign_batch(self):
+        items = []
+        for secret in (1, 2, 8675309, randint(1, N-1)):
+            pk = PrivateKey(secret)
+            for z in (1, 2**255, randint(0, 2**256)):
+                items.append((pk, z))
+        self.assertEqual(sign_batch([]), [])
+        for (pk, z), sig in zip(items, sign_batch(items)):
+            want = pk.sign(z)
+            self.assertEqual((sig.r, sig.s), (want.r, want.s))
+            self.assertTrue(sig.s <= N//2)
+
+    def test_address_batch(self):
+        points = [PrivateKey(secret).point for secret in (1, 8675309, randint(1, N-1))]
+        batch = AddressBatch(points)
+        for compressed in (True, False):
+            self.assertEqual(batch.secs(compressed), [p.sec(compressed) for p in points])
+            self.assertEqual(batch.h160s(compressed), [p.h160(compressed) for p in points])
+            for prefix in (b'\x00', b'\x6f', b'\x26'):
+                want = [p.address(compressed, prefix) for p in points]
+                self.assertEqual(batch.addresses(compressed, prefix), want)
+        for prefix in (b'\x05', b'\xc4'):
+            want = [p.segwit_address(prefix) for p in points]
+            self.assertEqual(batch.segwit_addresses(prefix), want)
+        # every intermediate was computed once
+        self.assertEqual(len(batch.cache), 5)
+        self.assertIs(batch.h160s(), batch.h160s())
+        self.assertEqual(AddressBatch([]).addresses(), [])
+
+    def test_mul_g_batch(self):
+        secrets = [1, 2, 8675309, N-1, randint(1, N-1)]
+        self.assertEqual(mul_g_batch(secrets), [secret*G for secret in secrets])
+        self.assertEqual(mul_g_batch([]), [])
+
+    def test_derive_addresses(self):
+        secrets = [randint(1, N-1) for _ in range(7)]
+        secrets.append(PrivateKey(8675309).wif())
+        prefixes = ((b'\x00', b'\x05'), (b'\x6f', b'\xc4'))
+        want = []
+        for secret in secrets[:-1] + [8675309]:
+            point = PrivateKey(secret).point
+            want.append([
+                (point.address(True, p2pkh), point.address(False, p2pkh),
+                 point.segwit_address(p2sh))
+                for p2pkh, p2sh in prefixes])
+        got = derive_addresses(secrets, prefixes, workers=2, chunk_size=3)
+        self.assertEqual(list(got), want)
+        got = derive_addresses(iter(secrets), prefixes[:1], workers=1)
+        self.assertEqual(list(got), [addresses[:1] for addresses in want])
+
+
+class BackendTest(TestCase):
+    '''The conformance corpus: every backend in BACKENDS has to give
+    exactly these results'''
+
+    mul_vectors = (
+        # secret, x, y of secret*G
+        (7, 0x5cbdf0646e5db4eaa398f365f2ea7a0e3d419b7e0330e39ce92bddedcac4f9bc, 0x6aebca40ba255960a3178d6d861a54dba813d0b813fde7b5a5082628087264da),
+        (1485, 0xc982196a7466fbbbb0e27a940b6af926c1a74d5ad07128c82824a11b5398afda, 0x7a91f9eae64438afb9ce6448a1c133db2d8fb9254e4546b6f001637d50901f55),
+        (2**128, 0x8f68b9d2f63b5f339239c1ad981f162ee88c5678723ea3351b7b444c9ec4c0da, 0x662a9f2dba063986de1d90c2b6be215dbbea2cfe95510bfdf23cbf79501fff82),
+        (2**240+2**31, 0x9577ff57c8234558f293df502ca4f09cbc65a6572c842b39b366f21717945116, 0x10b49c67fa9365ad7b90dab070be339a1daf9052373ec30ffae4f72d5e66d053),
+        (N-1, 0x79be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798, 0xb7c52588d95c3b9aa25b0403f1eef75702e84bb7597aabe663b82f6f04ef2777),
+    )
+    sec_vectors = (
+        # secret, uncompressed sec, compressed sec of secret*G
+        (999**3, '049d5ca49670cbe4c3bfa84c96a8c87df086c6ea6a24ba6b809c9de234496808d56fa15cc7f3d38cda98dee2419f415b7513dde1301f8643cd9245aea7f3f911f9', '039d5ca49670cbe4c3bfa84c96a8c87df086c6ea6a24ba6b809c9de234496808d5'),
+        (123, '04a598a8030da6d86c6bc7f2f5144ea549d28211ea58faa70ebf4c1e665c1fe9b5204b5d6f84822c307e4b4a7140737aec23fc63b65b35f86a10026dbd2d864e6b', '03a598a8030da6d86c6bc7f2f5144ea549d28211ea58faa70ebf4c1e665c1fe9b5'),
+        (42424242, '04aee2e7d843f7430097859e2bc603abcc3274ff8169c1a469fee0f20614066f8e21ec53f40efac47ac1c5211b2123527e0e9b57ede790c4da1e72c91fb7da54a3', '03aee2e7d843f7430097859e2bc603abcc3274ff8169c1a469fee0f20614066f8e'),
+    )
+    sign_vectors = (
+        # secret, z, r, s
+        (8675309, 1, 0x194d21125798bb77f982d50c51f4fe47dd2f307aa07bb0cc499fd3e77d9f5842, 0x563df94591b40ba7463a91e8ee6fec5ee3029bf9d69d5a8e3dca162b1d4ba761),
+        (12345, 2**256-1, 0x9ded480d52fcea028cb611a0bbb877f83b4f1f7892c82ed90407ed155aab2de, 0x1748bdec868be4694ab6e224ee8f4fbf3056a33dab9587a806480450f396a83c),
+        (N-1, 0xec208baa0fc1c19f708a9ca96fdeff3ac3f230bb4a7ba4aede4942ad003c0f60, 0xb098a0bec8221ba99f9aabc738b1aae5cd83e5394431c280c4f5335ab5560132, 0x52afac6b30e7962131aaa250fc696a35c08d6d7918c2eb8d555443c26b8b6eb5),
+    )
+    verify_vectors = (
+        # x, y, z, r, s, valid
+        (0x887387e452b8eacc4acfde10d9aaf7f6d9a0f975aabb10d006e4da568744d06c, 0x61de6d95231cd89026e286df3b6ae4a894a3378e393e93a0f45b666329a0ae34, 0xec208baa0fc1c19f708a9ca96fdeff3ac3f230bb4a7ba4aede4942ad003c0f60, 0xac8d1c87e51d0d441be8b3dd5b05c8795b48875dffe00b7ffcfac23010d3a395, 0x68342ceff8935ededd102dd876ffd6ba72d6a427a3edb13d26eb0781cb423c4, True),
+        (0x887387e452b8eacc4acfde10d9aaf7f6d9a0f975aabb10d006e4da568744d06c, 0x61de6d95231cd89026e286df3b6ae4a894a3378e393e93a0f45b666329a0ae34, 0x7c076ff316692a3d7eb3c3bb0f8b1488cf72e1afcd929e29307032997a838a3d, 0xeff69ef2b1bd93a66ed5219add4fb51e11a840f404876325a1e8ffe0529a2c, 0xc7207fee197d27c618aea621406f6bf5ef6fca38681d82b2f06fddbdce6feab6, True),
+        (0x887387e452b8eacc4acfde10d9aaf7f6d9a0f975aabb10d006e4da568744d06c, 0x61de6d95231cd89026e286df3b6ae4a894a3378e393e93a0f45b666329a0ae34, 0x7c076ff316692a3d7eb3c3bb0f8b1488cf72e1afcd929e29307032997a838a3e, 0xeff69ef2b1bd93a66ed5219add4fb51e11a840f404876325a1e8ffe0529a2c, 0xc7207fee197d27c618aea621406f6bf5ef6fca38681d82b2f06fddbdce6feab6, False),
+        (0x887387e452b8eacc4acfde10d9aaf7f6d9a0f975aabb10d006e4da568744d06c, 0x61de6d95231cd89026e286df3b6ae4a894a3378e393e93a0f45b666329a0ae34, 0x7c076ff316692a3d7eb3c3bb0f8b1488cf72e1afcd929e29307032997a838a3d, 0xeff69ef2b1bd93a66ed5219add4fb51e11a840f404876325a1e8ffe0529a2c, 0, False),
+        # the first one again with s+N, the same number mod N
+        (0x887387e452b8eacc4acfde10d9aaf7f6d9a0f975aabb10d006e4da568744d06c, 0x61de6d95231cd89026e286df3b6ae4a894a3378e393e93a0f45b666329a0ae34, 0xec208baa0fc1c19f708a9ca96fdeff3ac3f230bb4a7ba4aede4942ad003c0f60, 0xac8d1c87e51d0d441be8b3dd5b05c8795b48875dffe00b7ffcfac23010d3a395, 0x68342ceff8935ededd102dd876ffd6ba72d6a427a3edb13d26eb0781cb423c4 + N, False),
+    )
+
+    def setUp(self):
+        self.previous = set_backend('fast')
+
+    def tearDown(self):
+        set_backend(self.previous)
+
+    def backends(self):
+        for name in sorted(BACKENDS):
+            set_backend(name)
+            yield name
+
+    def test_set_backend(self):
+        self.assertEqual(set_backend('reference'), 'fast')
+        self.assertEqual(set_backend('fast'), 'reference')
+        with self.assertRaises(RuntimeError):
+            set_backend('nonexistent')
+        self.assertEqual(S256Point.backend.name, 'fast')
+
+    def test_mul(self):
+        for name in self.backends():
+            for secret, x, y in self.mul_vectors:
+                point = secret*G
+                self.assertEqual((point.x_num, point.y_num), (x, y), name)
+                # and the same point from a base that isn't G
+                half = secret * pow(2, N-2, N) % N
+                self.assertEqual(half*(G + G), point, name)
+            self.assertIsNone((N*G).x, name)
+            self.assertEqual(5*(7*G), 35*G, name)
+            self.assertEqual(
+                S256Point.multi_mul([7, 1485, N-1], [G, G, 3*G]), 1489*G, name)
+
+    def test_add(self):
+        for name in self.backends():
+            self.assertEqual(G + G, 2*G, name)
+            self.assertEqual(2*G + 3*G, 5*G, name)
+            self.assertIsNone((G + (N-1)*G).x, name)
+            self.assertEqual(G + S256Point(None, None), G, name)
+            self.assertEqual(S256Point(None, None) + G, G, name)
+
+    def test_sec(self):
+        for name in self.backends():
+            for secret, uncompressed, compressed in self.sec_vectors:
+                point = S256Point.trusted(
+                    (secret*G).x_num, (secret*G).y_num)
+                for sec in (uncompressed, compressed):
+                    sec = unhexlify(sec)
+                    self.assertEqual(point.sec(sec[0] != 4), sec, name)
+                    self.assertEqual(
+                        S256Point.backend.parse(sec), point, name)
+            with self.assertRaises(RuntimeError):
+                S256Point.backend.parse(b'\x04' + (1).to_bytes(32, 'big') * 2)
+
+    def test_sign(self):
+        for name in self.backends():
+            items = [(PrivateKey(secret), z) for secret, z, _, _ in self.sign_vectors]
+            for (private_key, z), sig in zip(items, sign_batch(items)):
+                want = private_key.sign(z)
+                self.assertEqual((sig.r, sig.s), (want.r, want.s), name)
+            for (secret, z, r, s), (private_key, _) in zip(self.sign_vectors, items):
+                sig = private_key.sign(z)
+                self.assertEqual((sig.r, sig.s), (r, s), name)
+                self.assertTrue(private_key.point.verify(z, sig), name)
+
+    def test_verify(self):
+        for name in self.backends():
+            items = []
+            for x, y, z, r, s, valid in self.verify_vectors:
+                point = S256Point(x, y)
+                self.assertEqual(point.verify(z, Signature(r, s)), valid, name)
+                items.append((point, z, Signature(r, s)))
+            self.assertEqual(verify_batch(items), [2, 3, 4], name)
+
+
+class SchnorrTest(TestCase):
+
+    def test_sign_verify(self):
+        for secret in (1, 8675309, randint(1, N-1)):
+            pk = PrivateKey(secret)
+            z = randint(0, 2**256)
+            sig = pk.sign_schnorr(z)
+            self.assertTrue(pk.point.verify(z, sig))
+            self.assertFalse(pk.point.verify(z + 1, sig))
+            self.assertFalse(PrivateKey(secret + 1).point.verify(z, sig))
+            # deterministic, and never the ECDSA nonce
+            self.assertEqual(pk.sign_schnorr(z).serialize(), sig.serialize())
+            self.assertNotEqual(sig.r, pk.sign(z).r)
+            # the same with the reference backend
+            previous = set_backend('reference')
+            try:
+                self.assertTrue(pk.point.verify(z, sig))
+                self.assertEqual(pk.sign_schnorr(z).serialize(), sig.serialize())
+            finally:
+                set_backend(previous)
+
+    def test_serialize(self):
+        sig = PrivateKey(8675309).sign_schnorr(2**200)
+        parsed = SchnorrSignature.parse(sig.serialize())
+        self.assertEqual((parsed.r, parsed.s), (sig.r, sig.s))
+        with self.assertRaises(RuntimeError):
+            SchnorrSignature.parse(sig.serialize()[1:])
+
+    def test_verify_batch(self):
+        items = []
+        for secret in (1, 2, 8675309, randint(1, N-1)):
+            pk = PrivateKey(secret)
+            for z in (1, randint(0, 2**256)):
+                items.append((pk.point, z, pk.sign_schnorr(z)))
+        self.assertEqual(verify_schnorr_batch(items), [])
+        bad = list(items)
+        point, z, sig = bad[2]
+        bad[2] = (point, z + 1, sig)
+        bad[5] = (bad[5][0], bad[5][1], SchnorrSignature(sig.r, N))
+        self.assertEqual(verify_schnorr_batch(bad), [2, 5])
+        # the R points are only used once, their tables aren't cached
+        previous = set_backend('fast')
+        try:
+            cache = S256Point.odd_multiples_cache
+            cache.clear()
+            self.assertEqual(verify_schnorr_batch(items[4:]), [])
+            self.assertEqual(len(cache), 2)
+        finally:
+            set_backend(previous)
+        # verify_batch takes both kinds
+        pk = PrivateKey(12345)
+        mixed = bad + [(pk.point, 7, pk.sign(7)), (pk.point, 8, pk.sign(7))]
+        self.assertEqual(verify_batch(mixed), [2, 5, len(bad) + 1])
+
+
+class OperationCounterTest(TestCase):
+
+    def test_reference(self):
+        previous = set_backend('reference')
+        try:
+            with OperationCounter() as counter:
+                point = 12345*G
+        finally:
+            set_backend(previous)
+        self.assertEqual(point, PrivateKey(12345).point)
+        # 12345 is 0b11000000111001: 6 additions and 14 doublings
+        self.assertEqual(counter.counts['add'], 6)
+        self.assertEqual(counter.counts['double'], 14)
+        self.assertEqual(counter.counts['mul'], 1)
+        self.assertIn('mul', counter.seconds)
+
+    def test_fast(self):
+        previous = set_backend('fast')
+        pk = PrivateKey(randint(1, N-1))
+        try:
+            with OperationCounter() as counter:
+                sig = pk.sign(12345)
+                self.assertTrue(pk.point.verify(12345, sig))
+                sign_batch([(pk, 1), (pk, 2)])
+            with self.assertRaises(RuntimeError):
+                counter.stop()
+        finally:
+            set_backend(previous)
+        self.assertEqual(counter.counts['sign'], 3)
+        self.assertEqual(counter.counts['verify'], 1)
+        self.assertTrue(counter.counts['add'] > 0)
+        self.assertTrue(counter.counts['inverse'] > 0)
+        self.assertEqual(set(counter.seconds), {'mul', 'sign', 'sign_batch', 'verify'})
+        self.assertTrue(counter.total_seconds() > 0)
+        self.assertIn('total', counter.report())
+        # everything is put back
+        self.assertIs(ecc.jacobian_double, jacobian_double)
+        self.assertIs(S256Point.backend, BACKENDS['fast'])
+        self.assertIsNone(OperationCounter.active)
+
+    def test_schnorr(self):
+        pk = PrivateKey(randint(1, N-1))
+        with OperationCounter() as counter:
+            sig = pk.sign_schnorr(12345)
+            self.assertTrue(pk.point.verify(12345, sig))
+            items = [(pk.point, 12345, sig), (pk.point, 12346, sig)]
+            self.assertEqual(verify_batch(items), [1])
+        self.assertEqual(counter.counts['sign'], 1)
+        self.assertEqual(counter.counts['verify'], 3)
+        self.assertTrue(counter.counts['mul'] > 0)
+        self.assertEqual(
+            {'sign_schnorr', 'verify_schnorr', 'verify_schnorr_batch'},
+            set(counter.seconds) - {'mul'})
+
+    def test_nested(self):
+        with OperationCounter():
+            with self.assertRaises(RuntimeError):
+                OperationCounter().start()
+
 
 class SignatureTest(TestCase):
 
@@ -300,9 +866,48 @@ class SignatureTest(TestCase):
             self.assertEqual(sig2.r, r)
             self.assertEqual(sig2.s, s)
 
+    def test_der_many(self):
+        sigs = [Signature(randint(1, N-1), randint(1, N-1)) for _ in range(5)]
+        sigs.append(Signature(0x80, 0x7f))
+        ders = Signature.der_many(sigs)
+        self.assertEqual(ders[-1], unhexlify('3007020200800201' + '7f'))
+        for sig, sig2 in zip(sigs, Signature.parse_many(ders, strict=True)):
+            self.assertEqual((sig2.r, sig2.s), (sig.r, sig.s))
+
+    def test_parse_strict(self):
+        # r padded with an unneeded 00, and s negative
+        padded = unhexlify('300702020001020101')
+        negative = unhexlify('3006020101020181')
+        for der in (padded, negative):
+            sig = Signature.parse(der)
+            self.assertIn((sig.r, sig.s), ((1, 1), (1, 0x81)))
+            with self.assertRaises(RuntimeError):
+                Signature.parse(der, strict=True)
+        bad = (
+            unhexlify('3106020101020101'),  # not a sequence
+            unhexlify('3007020101020101'),  # wrong total length
+            unhexlify('3006020801020101'),  # r runs past the end
+            unhexlify('3006020101030101'),  # s is not an integer
+            unhexlify('30060201010201'),  # truncated
+        )
+        for der in bad:
+            with self.assertRaises(RuntimeError):
+                Signature.parse(der)
+
 
 class PrivateKeyTest(TestCase):
 
+    def test_point(self):
+        pk = PrivateKey(8675309)
+        self.assertIsNone(pk._point)
+        # neither signing nor the wif needs the public point
+        sig = pk.sign(1)
+        pk.wif()
+        self.assertIsNone(pk._point)
+        self.assertEqual(pk.point, 8675309*G)
+        self.assertIs(pk.point, pk._point)
+        self.assertTrue(pk.point.verify(1, sig))
+
     def test_sign(self):
         pk = PrivateKey(randint(0, 2**256))
         z = randint(0, 2**256)
@@ -32,14 +32,22 @@ class HDPrivateKey(LibBitcoinClient):
         self.fingerprint = fingerprint
         self.child_number = child_number
         self.testnet = self.private_key.testnet
-        self.pub = HDPublicKey(
-            point=self.private_key.point,
-            chain_code=chain_code,
-            depth=depth,
-            fingerprint=fingerprint,
-            child_number=child_number,
-            testnet=self.testnet,
-        )
+        self._pub = None
+
+    @property
+    def pub(self):
+        # made on first use: a key that's only used to sign never needs
+        # its public point (children do need it, for their fingerprint)
+        if self._pub is None:
+            self._pub = HDPublicKey(
+                point=self.private_key.point,
+                chain_code=self.chain_code,
+                depth=self.depth,
+                fingerprint=self.fingerprint,
+                child_number=self.child_number,
+                testnet=self.testnet,
+            )
+        return self._pub
 
     def xprv(self):
         if self.testnet:
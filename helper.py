@@ -1,13 +1,27 @@
 from binascii import hexlify, unhexlify
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
 
 import hashlib
 import math
+import os
+import struct
 
 
 SIGHASH_ALL = 1
 SIGHASH_NONE = 2
 SIGHASH_SINGLE = 3
 BASE58_ALPHABET = b'123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+# the value of each byte as a base58 digit, 255 if it isn't one
+BASE58_DECODE = bytes(
+    BASE58_ALPHABET.find(bytes([c])) % 256 for c in range(256))
+# 58**10 is the largest power of 58 below 2**63, so a chunk of 10 digits
+# is a small number
+BASE58_CHUNK_DIGITS = 10
+BASE58_CHUNK = 58 ** BASE58_CHUNK_DIGITS
+# every two digit string, indexed by its value
+BASE58_PAIRS = [bytes([a, b]) for a in BASE58_ALPHABET for b in BASE58_ALPHABET]
 
 
 def hash160(s):
@@ -20,21 +34,22 @@ def double_sha256(s):
 
 def encode_base58(s):
     # determine how many 0 bytes (b'\x00') s starts with
-    count = 0
-    for c in s:
-        if c == 0:
-            count += 1
-        else:
-            break
+    count = len(s) - len(s.lstrip(b'\x00'))
     prefix = b'1' * count
     # convert from binary to hex, then hex to integer
     num = int.from_bytes(s, 'big')
-    result = bytearray()
+    # peel off 10 digits at a time so that most of the divisions are
+    # on small numbers instead of the whole big one, then write each
+    # chunk out two digits at a time
+    parts = []
     while num > 0:
-        num, mod = divmod(num, 58)
-        result.insert(0, BASE58_ALPHABET[mod])
-
-    return prefix + bytes(result)
+        num, chunk = divmod(num, BASE58_CHUNK)
+        for _ in range(BASE58_CHUNK_DIGITS // 2):
+            chunk, pair = divmod(chunk, 58 * 58)
+            parts.append(BASE58_PAIRS[pair])
+    # parts came out least significant first, and the top chunk is padded
+    # with zeros, which aren't part of the number
+    return prefix + b''.join(reversed(parts)).lstrip(b'1')
 
 
 def encode_base58_checksum(s):
@@ -42,10 +57,18 @@ def encode_base58_checksum(s):
 
 
 def decode_base58(s, num_bytes=25, strip_leading_zeros=False):
+    # every character to its value in one go, 255 for the invalid ones
+    digits = s.encode('ascii').translate(BASE58_DECODE)
+    if b'\xff' in digits:
+        raise ValueError('invalid base58 character in {}'.format(s))
     num = 0
-    for c in s.encode('ascii'):
-        num *= 58
-        num += BASE58_ALPHABET.index(c)
+    # 10 digits at a time into a small number, then into the big one
+    for start in range(0, len(digits), BASE58_CHUNK_DIGITS):
+        part = digits[start:start + BASE58_CHUNK_DIGITS]
+        chunk = 0
+        for digit in part:
+            chunk = chunk * 58 + digit
+        num = num * 58 ** len(part) + chunk
     combined = num.to_bytes(num_bytes, byteorder='big')
     if strip_leading_zeros:
         while combined[0] == 0:
@@ -57,6 +80,39 @@ def decode_base58(s, num_bytes=25, strip_leading_zeros=False):
     return payload
 
 
+def encode_base58_checksum_chunk(items):
+    return [encode_base58_checksum(s) for s in items]
+
+
+def encode_base58_checksum_many(items, workers=1, chunk_size=1000):
+    '''Returns the list of encode_base58_checksum(s) for each of items,
+    split over workers processes if there's more than one'''
+    return list(map_chunks(
+        encode_base58_checksum_chunk, items, chunk_size, workers))
+
+
+def decode_base58_chunk(items, num_bytes, strip_leading_zeros):
+    result = []
+    for s in items:
+        try:
+            result.append((decode_base58(s, num_bytes, strip_leading_zeros), None))
+        except (ValueError, OverflowError, IndexError) as e:
+            # bad characters or checksum, too long, or nothing but zeros
+            result.append((None, e))
+    return result
+
+
+def decode_base58_many(items, num_bytes=25, strip_leading_zeros=False,
+                       workers=1, chunk_size=1000):
+    '''Decodes each of items like decode_base58. Returns a list of
+    (payload, None) for the good ones and (None, error) for the bad ones,
+    so one bad string doesn't stop the rest. Split over workers processes
+    if there's more than one.'''
+    return list(map_chunks(
+        decode_base58_chunk, items, chunk_size, workers,
+        (num_bytes, strip_leading_zeros)))
+
+
 def p2pkh_script(h160):
     '''Takes a hash160 and returns the scriptPubKey'''
     return b'\x76\xa9\x14' + h160 + b'\x88\xac'
@@ -84,6 +140,322 @@ def read_varint(s):
         return i
 
 
+# the fixed size integers of the serializations, all little endian
+UINT16 = struct.Struct('<H')
+UINT32 = struct.Struct('<I')
+UINT64 = struct.Struct('<Q')
+unpack_uint16 = UINT16.unpack_from
+unpack_uint32 = UINT32.unpack_from
+unpack_uint64 = UINT64.unpack_from
+pack_uint16 = UINT16.pack
+pack_uint32 = UINT32.pack
+pack_uint64 = UINT64.pack
+
+
+class StreamCursor:
+    '''Reads the fields of a serialization from a stream. The parsers all
+    read through these methods, so that they can take a ByteCursor, which
+    does the same without the stream, or any stream, wrapped in one of
+    these by ByteCursor.wrap.'''
+
+    def __init__(self, stream):
+        self.stream = stream
+        # reads up to n bytes, it's the stream's own read
+        self.read = stream.read
+
+    def read_bytes(self, n):
+        '''Reads exactly n bytes'''
+        data = self.stream.read(n)
+        if len(data) != n:
+            raise RuntimeError('needed {} bytes, got {}'.format(n, len(data)))
+        return data
+
+    def read_hash(self):
+        '''Reads a 32 byte hash, reversed from the little endian it's
+        serialized in'''
+        return self.read_bytes(32)[::-1]
+
+    def unpack(self, fmt):
+        '''Reads the fields of the struct.Struct fmt, returns the tuple'''
+        return fmt.unpack(self.read_bytes(fmt.size))
+
+    def read_u8(self):
+        return self.read_bytes(1)[0]
+
+    def read_u16le(self):
+        return UINT16.unpack(self.read_bytes(2))[0]
+
+    def read_u32le(self):
+        return UINT32.unpack(self.read_bytes(4))[0]
+
+    def read_u64le(self):
+        return UINT64.unpack(self.read_bytes(8))[0]
+
+    def read_varint(self):
+        '''Same as read_varint'''
+        i = self.read_u8()
+        if i < 0xfd:
+            return i
+        elif i == 0xfd:
+            return self.read_u16le()
+        elif i == 0xfe:
+            return self.read_u32le()
+        else:
+            return self.read_u64le()
+
+    def read_varbytes(self):
+        '''Reads a varint length and then that many bytes'''
+        return self.read_bytes(self.read_varint())
+
+    def skip(self, n):
+        self.read_bytes(n)
+
+    def finish(self):
+        '''Called by whoever wrapped the stream once they're done reading.
+        The stream has moved on as it was read, so there's nothing to do'''
+
+
+class ByteCursor(StreamCursor):
+    '''Reads the fields of a serialization straight out of a buffer
+    (bytes, bytearray, mmap...) without copying it. Numbers are unpacked
+    in place and skip doesn't read anything, where every read from a
+    BytesIO makes a new bytes object.'''
+
+    def __init__(self, data, position=0):
+        # bytes can be sliced as they are, anything else goes through a
+        # memoryview so that it isn't copied, and only the slices are
+        self.is_view = type(data) != bytes
+        if self.is_view:
+            data = memoryview(data)
+        self.data = data
+        self.position = position
+        # the BytesIO this reads the buffer of, see wrap
+        self.source = None
+
+    @classmethod
+    def wrap(cls, s):
+        '''Returns s if it's already a cursor, a ByteCursor over it if it's
+        a buffer or a BytesIO and a StreamCursor reading from it if it's
+        any other stream. Whoever wraps s calls finish on the result once
+        they're done reading.'''
+        if isinstance(s, StreamCursor):
+            return s
+        if isinstance(s, BytesIO):
+            # read the BytesIO's buffer in place from where it's at,
+            # finish moves it on to where the cursor got to. getvalue
+            # hands back the bytes the BytesIO holds without copying them,
+            # and unlike getbuffer doesn't stop it being written to
+            cursor = cls(s.getvalue(), s.tell())
+            cursor.source = s
+            return cursor
+        if isinstance(s, (bytes, bytearray, memoryview)):
+            return cls(s)
+        return StreamCursor(s)
+
+    def finish(self):
+        '''Moves the BytesIO this was wrapped around on to where the cursor
+        got to. Nothing to do if this wasn't made by wrap from a BytesIO'''
+        if self.source is not None:
+            self.source.seek(self.position)
+            self.source = None
+
+    def remaining(self):
+        return len(self.data) - self.position
+
+    def short(self, n):
+        return RuntimeError('needed {} bytes, got {}'.format(
+            n, max(self.remaining(), 0)))
+
+    def read(self, n):
+        start = self.position
+        self.position = min(start + n, len(self.data))
+        if self.is_view:
+            return self.data[start:self.position].tobytes()
+        return self.data[start:self.position]
+
+    def read_bytes(self, n):
+        start = self.position
+        end = start + n
+        if end > len(self.data):
+            raise self.short(n)
+        self.position = end
+        if self.is_view:
+            return self.data[start:end].tobytes()
+        return self.data[start:end]
+
+    def read_hash(self):
+        start = self.position
+        end = start + 32
+        if end > len(self.data):
+            raise self.short(32)
+        self.position = end
+        if self.is_view:
+            return self.data[start:end].tobytes()[::-1]
+        return self.data[start:end][::-1]
+
+    def unpack(self, fmt):
+        position = self.position
+        try:
+            values = fmt.unpack_from(self.data, position)
+        except struct.error:
+            raise self.short(fmt.size)
+        self.position = position + fmt.size
+        return values
+
+    def read_u8(self):
+        position = self.position
+        try:
+            value = self.data[position]
+        except IndexError:
+            raise self.short(1)
+        self.position = position + 1
+        return value
+
+    def read_u16le(self):
+        position = self.position
+        try:
+            value, = unpack_uint16(self.data, position)
+        except struct.error:
+            raise self.short(2)
+        self.position = position + 2
+        return value
+
+    def read_u32le(self):
+        position = self.position
+        try:
+            value, = unpack_uint32(self.data, position)
+        except struct.error:
+            raise self.short(4)
+        self.position = position + 4
+        return value
+
+    def read_u64le(self):
+        position = self.position
+        try:
+            value, = unpack_uint64(self.data, position)
+        except struct.error:
+            raise self.short(8)
+        self.position = position + 8
+        return value
+
+    def read_varint(self):
+        # the one byte case is by far the most common, so it's done here
+        # instead of through read_u8
+        position = self.position
+        try:
+            i = self.data[position]
+        except IndexError:
+            raise self.short(1)
+        self.position = position + 1
+        if i < 0xfd:
+            return i
+        elif i == 0xfd:
+            return self.read_u16le()
+        elif i == 0xfe:
+            return self.read_u32le()
+        else:
+            return self.read_u64le()
+
+    def read_varbytes(self):
+        # a one byte length is done here, anything longer through
+        # read_varint
+        position = self.position
+        try:
+            n = self.data[position]
+        except IndexError:
+            raise self.short(1)
+        if n < 0xfd:
+            start = position + 1
+        else:
+            n = self.read_varint()
+            start = self.position
+        end = start + n
+        if end > len(self.data):
+            raise self.short(n)
+        self.position = end
+        if self.is_view:
+            return self.data[start:end].tobytes()
+        return self.data[start:end]
+
+    def skip(self, n):
+        if n > self.remaining():
+            raise self.short(n)
+        self.position += n
+
+
+class ByteWriter:
+    '''Writes the fields of a serialization into one growable bytearray,
+    the other way round from ByteCursor. Each serialize_into writes its
+    fields straight after the ones already there, where adding bytes
+    objects together copies everything serialized so far every time.'''
+
+    def __init__(self):
+        self.data = bytearray()
+        # writes raw bytes as they are, it's the bytearray's own extend
+        self.write = self.data.extend
+
+    def __len__(self):
+        return len(self.data)
+
+    def getvalue(self):
+        '''Returns the serialization as bytes'''
+        return bytes(self.data)
+
+    def write_hash(self, h):
+        '''Writes a 32 byte hash reversed, the little endian it's
+        serialized in'''
+        self.data += h[::-1]
+
+    def pack(self, fmt, *values):
+        '''Writes the values as the fields of the struct.Struct fmt'''
+        self.data += fmt.pack(*values)
+
+    def write_u8(self, i):
+        self.data.append(i)
+
+    def write_u16le(self, i):
+        self.data += pack_uint16(i)
+
+    def write_u32le(self, i):
+        self.data += pack_uint32(i)
+
+    def write_u64le(self, i):
+        self.data += pack_uint64(i)
+
+    def write_varint(self, i):
+        '''Same as encode_varint'''
+        if i < 0xfd:
+            self.data.append(i)
+        elif i < 0x10000:
+            self.data.append(0xfd)
+            self.data += pack_uint16(i)
+        elif i < 0x100000000:
+            self.data.append(0xfe)
+            self.data += pack_uint32(i)
+        elif i < 0x10000000000000000:
+            self.data.append(0xff)
+            self.data += pack_uint64(i)
+        else:
+            raise ValueError('integer too large: {}'.format(i))
+
+    def write_varbytes(self, b):
+        '''Writes the varint length of b and then b'''
+        self.write_varint(len(b))
+        self.data += b
+
+    def write_prefixed(self, item):
+        '''Writes item with its serialize_into and puts the varint of its
+        length in front, without serializing it on its own first'''
+        start = len(self.data)
+        item.serialize_into(self)
+        length = len(self.data) - start
+        if length < 0xfd:
+            # only item's own bytes move up to make room
+            self.data.insert(start, length)
+        else:
+            self.data[start:start] = encode_varint(length)
+
+
 def encode_varint(i):
     '''encodes an integer as a varint'''
     if i < 0xfd:
@@ -150,9 +522,9 @@ def merkle_parent_level(hash_list):
         raise RuntimeError('Cannot take a parent level with only 1 item')
     # Exercise 3.2: if the list has an odd number of elements, duplicate the
     #               last one and put it at the end so it has an even number
-    #               of elements
+    #               of elements (in a new list, the caller's is left alone)
     if len(hash_list) % 2 == 1:
-        hash_list.append(hash_list[-1])
+        hash_list = hash_list + [hash_list[-1]]
     # Exercise 2.2: initialize next level
     parent_level = []
     # Exercise 2.2: loop over every pair
@@ -179,6 +551,69 @@ def merkle_root(hash_list):
     return current_level[0]
 
 
+class MerkleAccumulator:
+    '''Takes the binary hashes of the leaves one at a time and gives the
+    same merkle root as merkle_root would of all of them. Only the root
+    of each complete subtree still waiting for a partner is kept, at most
+    one per level, so a block's worth of hashes never has to be held.'''
+
+    def __init__(self, hashes=()):
+        # pending[height] is the root of a complete subtree of 2**height
+        # leaves, or None. Like the bits of count, the top one is always set
+        self.pending = []
+        self.count = 0
+        self.extend(hashes)
+
+    def __len__(self):
+        return self.count
+
+    def add(self, leaf):
+        '''Adds the next leaf'''
+        node = leaf
+        # carry up the levels like adding 1 to a binary number: each
+        # pending subtree on the way is the left partner of node
+        for height, left in enumerate(self.pending):
+            if left is None:
+                self.pending[height] = node
+                break
+            self.pending[height] = None
+            node = merkle_parent(left, node)
+        else:
+            self.pending.append(node)
+        self.count += 1
+
+    def extend(self, hashes):
+        '''Adds the leaves from any iterable, a generator is never held'''
+        for leaf in hashes:
+            self.add(leaf)
+
+    def root(self):
+        '''Returns the merkle root of the leaves so far. More can still
+        be added afterwards'''
+        if self.count == 0:
+            raise RuntimeError('Cannot take the merkle root of no hashes')
+        top = len(self.pending) - 1
+        # node is the root of the subtree of everything below height,
+        # which goes up one level each time around
+        node = None
+        for left in self.pending[:top]:
+            if node is None:
+                # the lowest subtree is the last at its level and an odd
+                # one out, so it's paired with itself like
+                # merkle_parent_level does
+                if left is not None:
+                    node = merkle_parent(left, left)
+            elif left is None:
+                # now node is the odd one out at its level
+                node = merkle_parent(node, node)
+            else:
+                node = merkle_parent(left, node)
+        if node is None:
+            # the number of leaves is a power of 2
+            return self.pending[top]
+        return merkle_parent(self.pending[top], node)
+
+
 def merkle_path(index, total):
     '''Returns a list of indexes up the merkle tree of the node at index if
     there are a total number of nodes'''
@@ -194,3 +629,84 @@ def merkle_path(index, total):
         index = index // 2
     # return the path
     return path
+
+
+class LRUCache:
+    '''A mapping of bounded size that evicts the least recently used key
+    and counts hits and misses'''
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.data = OrderedDict()
+
+    def __repr__(self):
+        return 'LRUCache(size={}, maxsize={}, hits={}, misses={})'.format(
+            len(self.data), self.maxsize, self.hits, self.misses)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def clear(self):
+        self.data.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+def chunked(items, size):
+    '''Yields lists of size consecutive items, the last one shorter if
+    there aren't enough'''
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def map_chunks(function, items, chunk_size=1000, workers=None, args=()):
+    '''Yields the items of function(chunk, *args) for consecutive chunks of
+    items, in order, running the chunks in a pool of worker processes.
+    function has to be a module-level function so it can be pickled.
+    Only twice as many chunks as workers are in flight at once, so items
+    can be a long generator and memory stays bounded. With one worker,
+    no processes are started.'''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers == 1:
+        for chunk in chunked(items, chunk_size):
+            for result in function(chunk, *args):
+                yield result
+        return
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for chunk in chunked(items, chunk_size):
+            pending.append(executor.submit(function, chunk, *args))
+            if len(pending) >= 2 * workers:
+                for result in pending.popleft().result():
+                    yield result
+        while pending:
+            for result in pending.popleft().result():
+                yield result
@@ -3,12 +3,20 @@ from io import BytesIO
 from unittest import TestCase
 
 from helper import (
+    ByteCursor,
+    ByteWriter,
+    chunked,
     decode_base58,
+    decode_base58_many,
+    encode_base58,
     encode_base58_checksum,
+    encode_base58_checksum_many,
     encode_varint,
     flip_endian,
     little_endian_to_int,
     int_to_little_endian,
+    map_chunks,
+    MerkleAccumulator,
     h160_to_p2pkh_address,
     h160_to_p2sh_address,
     merkle_parent,
@@ -18,6 +26,7 @@ from helper import (
     p2pkh_script,
     p2sh_script,
     read_varint,
+    LRUCache,
 )
 
 
@@ -33,6 +42,32 @@ class HelperTest(TestCase):
         wif = '5HpHagT65TZzG1PH3CSu63k8DbpvD8s5ip4nEB3kEsreAnchuDf'
         want = unhexlify('800000000000000000000000000000000000000000000000000000000000000001')
         self.assertEqual(decode_base58(wif, num_bytes=38, strip_leading_zeros=True), want)
+        # leading zeros, zero chunks and more than one chunk of digits
+        self.assertEqual(encode_base58(b''), b'')
+        self.assertEqual(encode_base58(b'\x00\x00\x01'), b'112')
+        self.assertEqual(encode_base58(b'\x00' + (58**10).to_bytes(8, 'big')), b'12' + b'1' * 10)
+        self.assertEqual(encode_base58(b'\xff' * 8), b'jpXCZedGfVQ')
+        for payload in (b'\x00' * 3, b'\x00\x05' + b'\x00' * 20, bytes(range(78))):
+            encoded = encode_base58_checksum(payload)
+            self.assertEqual(decode_base58(encoded, num_bytes=len(payload) + 4), payload)
+        self.assertRaises(ValueError, decode_base58, '1BenRpVUFK65JFWcQSuHnJKzc4M8ZP8EqI')
+
+    def test_base58_many(self):
+        payloads = [unhexlify('0074d691da1574e6b3c192ecfb52cc8984ee7b6c56'), b'\x05' * 21, b'\x00' * 21]
+        addrs = encode_base58_checksum_many(iter(payloads))
+        self.assertEqual(addrs, [encode_base58_checksum(p) for p in payloads])
+        self.assertEqual(encode_base58_checksum_many(payloads, workers=2, chunk_size=2), addrs)
+        strings = addrs + [addrs[0] + '1', 'I' + addrs[1], addrs[2]]
+        for workers in (1, 2):
+            results = decode_base58_many(strings, workers=workers, chunk_size=2)
+            self.assertEqual([payload for payload, _ in results], payloads + [None, None, payloads[2]])
+            errors = [error for _, error in results]
+            self.assertEqual(errors[:3] + errors[5:], [None] * 4)
+            self.assertIsInstance(errors[3], ValueError)
+            self.assertIsInstance(errors[4], ValueError)
+        wif = '5HpHagT65TZzG1PH3CSu63k8DbpvD8s5ip4nEB3kEsreAnchuDf'
+        want = unhexlify('800000000000000000000000000000000000000000000000000000000000000001')
+        self.assertEqual(decode_base58_many([wif], 38, True), [(want, None)])
 
     def test_p2pkh_script(self):
         h160 = unhexlify('74d691da1574e6b3c192ecfb52cc8984ee7b6c56')
@@ -154,6 +189,8 @@ class HelperTest(TestCase):
         ]
         want_tx_hashes = [unhexlify(x) for x in want_hex_hashes]
         self.assertEqual(merkle_parent_level(tx_hashes), want_tx_hashes)
+        # the odd level is padded without touching the caller's list
+        self.assertEqual(len(tx_hashes), 11)
 
     def test_merkle_root(self):
         hex_hashes = [
@@ -175,8 +212,130 @@ class HelperTest(TestCase):
         want_hash = unhexlify(want_hex_hash)
         self.assertEqual(merkle_root(tx_hashes), want_hash)
 
+    def test_merkle_accumulator(self):
+        hex_hashes = [
+            'c117ea8ec828342f4dfb0ad6bd140e03a50720ece40169ee38bdc15d9eb64cf5',
+            'c131474164b412e3406696da1ee20ab0fc9bf41c8f05fa8ceea7a08d672d7cc5',
+            'f391da6ecfeed1814efae39e7fcb3838ae0b02c02ae7d0a5848a66947c0727b0',
+            '3d238a92a94532b946c90e19c49351c763696cff3db400485b813aecb8a13181',
+            '10092f2633be5f3ce349bf9ddbde36caa3dd10dfa0ec8106bce23acbff637dae',
+            '7d37b3d54fa6a64869084bfd2e831309118b9e833610e6228adacdbd1b4ba161',
+            '8118a77e542892fe15ae3fc771a4abfd2f5d5d5997544c3487ac36b5c85170fc',
+            'dff6879848c2c9b62fe652720b8df5272093acfaa45a43cdb3696fe2466a3877',
+            'b825c0745f46ac58f7d3759e6dc535a1fec7820377f24d4c2c6ad2cc55c0cb59',
+            '95513952a04bd8992721e9b7e2937f1c04ba31e0469fbe615a78197f68f52b7c',
+            '2e6d722e5e4dbdf2447ddecc9f7dabb8e299bae921c99ad5b0184cd9eb8e5908',
+            'b13a750047bc0bdceb2473e5fe488c2596d7a7124b4e716fdd29b046ef99bbf0',
+        ]
+        tx_hashes = [unhexlify(x) for x in hex_hashes]
+        want_hash = unhexlify('acbcab8bcc1af95d8d563b77d24c3d19b18f1486383d75a5085c4e86c86beed6')
+        self.assertEqual(MerkleAccumulator(iter(tx_hashes)).root(), want_hash)
+        # every count from 1 up, odd ones out at different levels included
+        accumulator = MerkleAccumulator()
+        with self.assertRaises(RuntimeError):
+            accumulator.root()
+        for n, tx_hash in enumerate(tx_hashes * 3, 1):
+            accumulator.add(tx_hash)
+            self.assertEqual(len(accumulator), n)
+            self.assertLessEqual(len(accumulator.pending), n.bit_length())
+            self.assertEqual(accumulator.root(), merkle_root((tx_hashes * 3)[:n]))
+
     def test_merkle_path(self):
         i = 7
         total = 11
         want = [7, 3, 1, 0]
         self.assertEqual(merkle_path(i, total), want)
+
+    def test_lru_cache(self):
+        cache = LRUCache(maxsize=2)
+        cache.put(b'a', 1)
+        cache.put(b'b', 2)
+        self.assertEqual(cache.get(b'a'), 1)
+        # b is now the least recently used
+        cache.put(b'c', 3)
+        self.assertNotIn(b'b', cache)
+        self.assertIsNone(cache.get(b'b'))
+        self.assertEqual(cache.get(b'c'), 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        cache.clear()
+        self.assertEqual((len(cache), cache.hits, cache.misses), (0, 0, 0))
+
+    def test_map_chunks(self):
+        self.assertEqual(list(chunked(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(chunked([], 2)), [])
+        items = (n for n in range(50))
+        # list is picklable and gives each chunk back as it was
+        self.assertEqual(list(map_chunks(list, items, 7, workers=2)), list(range(50)))
+        # with one worker nothing is pickled, so a lambda is fine
+        scale = lambda chunk, n: [item * n for item in chunk]
+        self.assertEqual(list(map_chunks(scale, [3, 1, 2], 2, workers=1, args=(10,))), [30, 10, 20])
+
+    def test_byte_cursor(self):
+        data = b'\x01\xfd\x00\x01' + int_to_little_endian(5, 4) + int_to_little_endian(2**40, 8)
+        data += bytes(range(32)) + b'\x02ab' + b'tail'
+        for cursor in (ByteCursor(data), ByteCursor(bytearray(data)), ByteCursor.wrap(BytesIO(data))):
+            self.assertEqual(cursor.read_u8(), 1)
+            self.assertEqual(cursor.read_varint(), 256)
+            self.assertEqual(cursor.read_u32le(), 5)
+            self.assertEqual(cursor.read_u64le(), 2**40)
+            self.assertEqual(cursor.read_hash(), bytes(range(32))[::-1])
+            self.assertEqual(cursor.read_varbytes(), b'ab')
+            cursor.skip(2)
+            # read is lenient at the end like a stream, the others aren't
+            self.assertEqual(cursor.read(10), b'il')
+            with self.assertRaises(RuntimeError):
+                cursor.read_bytes(1)
+            with self.assertRaises(RuntimeError):
+                cursor.read_u32le()
+        cursor = ByteCursor(data, 1)
+        self.assertIs(ByteCursor.wrap(cursor), cursor)
+        self.assertEqual(cursor.read_varint(), 256)
+        self.assertEqual(cursor.remaining(), len(data) - 4)
+        self.assertEqual(type(ByteCursor(bytearray(data)).read_bytes(2)), bytes)
+        self.assertEqual(type(ByteCursor.wrap(data)), ByteCursor)
+        # a BytesIO is read in place from where it's at, and finish moves
+        # it on to where the cursor got to
+        stream = BytesIO(data)
+        stream.read(1)
+        cursor = ByteCursor.wrap(stream)
+        self.assertEqual(type(cursor), ByteCursor)
+        self.assertEqual(cursor.read_varint(), 256)
+        self.assertEqual(stream.tell(), 1)
+        cursor.finish()
+        self.assertEqual(stream.tell(), 4)
+        self.assertEqual(stream.read(4), int_to_little_endian(5, 4))
+
+    def test_byte_writer(self):
+        writer = ByteWriter()
+        writer.write_u8(1)
+        writer.write_varint(256)
+        writer.write_u32le(5)
+        writer.write_u64le(2**40)
+        writer.write_hash(bytes(range(32)))
+        writer.write_varbytes(b'ab')
+        writer.write(b'tail')
+        # the same bytes test_byte_cursor reads
+        data = b'\x01\xfd\x00\x01' + int_to_little_endian(5, 4) + int_to_little_endian(2**40, 8)
+        data += bytes(range(32))[::-1] + b'\x02ab' + b'tail'
+        self.assertEqual(writer.getvalue(), data)
+        self.assertEqual(len(writer), len(data))
+        for i in (0, 0xfc, 0xfd, 0xffff, 0x10000, 2**32, 2**64 - 1):
+            writer = ByteWriter()
+            writer.write_varint(i)
+            self.assertEqual(writer.getvalue(), encode_varint(i))
+        with self.assertRaises(ValueError):
+            ByteWriter().write_varint(2**64)
+
+        class Item:
+            def __init__(self, data):
+                self.data = data
+
+            def serialize_into(self, writer):
+                writer.write(self.data)
+
+        for length in (0, 5, 0xfc, 0xfd, 1000):
+            writer = ByteWriter()
+            writer.write(b'head')
+            writer.write_prefixed(Item(b'x' * length))
+            self.assertEqual(writer.getvalue(), b'head' + encode_varint(length) + b'x' * length)
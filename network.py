@@ -1,13 +1,13 @@
 import asyncio
 import time
-from io import BytesIO
 
 from helper import (
+    ByteCursor,
+    ByteWriter,
     double_sha256,
     encode_varint,
     int_to_little_endian,
     little_endian_to_int,
-    read_varint,
 )
 
 
@@ -54,17 +54,23 @@ class NetworkEnvelope:
 
     def serialize(self):
         '''Returns the byte serialization of the entire network message'''
+        writer = ByteWriter()
+        self.serialize_into(writer)
+        return writer.getvalue()
+
+    def serialize_into(self, writer):
+        '''Writes the byte serialization of the entire network message to
+        the ByteWriter writer'''
         # add the network magic
-        result = self.magic
+        writer.write(self.magic)
         # command 12 bytes
-        result += self.command
+        writer.write(self.command)
         # payload length 4 bytes, little endian
-        result += int_to_little_endian(len(self.payload), 4)
+        writer.write_u32le(len(self.payload))
         # checksum 4 bytes, first four of double-sha256 of payload
-        result += double_sha256(self.payload)[:4]
+        writer.write(double_sha256(self.payload)[:4])
         # payload
-        result += self.payload
-        return result
+        writer.write(self.payload)
 
 
 class TxSender:
@@ -143,11 +149,11 @@ class TxSender:
                 minimum = little_endian_to_int(envelope.payload)
                 print('TX requires fee: {} minimum'.format(minimum))
             elif command == 'inv':
-                stream = BytesIO(envelope.payload)
-                num_inv = read_varint(stream)
+                s = ByteCursor(envelope.payload)
+                num_inv = s.read_varint()
                 for _ in range(num_inv):
-                    inv_type = little_endian_to_int(stream.read(4))
-                    inv_hash = stream.read(32)
+                    inv_type = s.read_u32le()
+                    inv_hash = s.read_bytes(32)
                     if inv_type == 1 and inv_hash == self.tx_hash:
                         print('TX successfully sent')
                         self.keep_looping = False
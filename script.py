@@ -1,7 +1,7 @@
 from binascii import hexlify
-from io import BytesIO
 
 from helper import (
+    ByteWriter,
     hash160,
     h160_to_p2pkh_address,
     h160_to_p2sh_address,
@@ -24,17 +24,21 @@ class Script:
 
     @classmethod
     def parse(cls, binary):
-        s = BytesIO(binary)
+        # walk through by index and slice the elements straight out, the
+        # elements have to be bytes whatever binary is
+        if type(binary) != bytes:
+            binary = bytes(binary)
         elements = []
-        current = s.read(1)
-        while current != b'':
-            op_code = current[0]
+        i, length = 0, len(binary)
+        while i < length:
+            op_code = binary[i]
+            i += 1
             if op_code > 0 and op_code <= 75:
                 # we have an element
-                elements.append(s.read(op_code))
+                elements.append(binary[i:i + op_code])
+                i += op_code
             else:
                 elements.append(op_code)
-            current = s.read(1)
         return cls(elements)
 
     def type(self):
@@ -82,13 +86,23 @@ class Script:
             return 'unknown: {}'.format(self)
 
     def serialize(self):
-        result = b''
+        writer = ByteWriter()
+        self.serialize_into(writer)
+        return writer.getvalue()
+
+    def serialize_into(self, writer):
+        '''Writes the script to the ByteWriter writer, without its length'''
+        # scripts are mostly a few short elements, so they go straight
+        # into the writer's bytearray rather than a call for each byte
+        data = writer.data
         for element in self.elements:
             if type(element) == int:
-                result += bytes([element])
+                # op codes are one byte
+                data.append(element)
             else:
-                result += bytes([len(element)]) + element
-        return result
+                # elements are pushed with their one byte length in front
+                data.append(len(element))
+                data += element
 
     def hash160(self):
         return hash160(self.serialize())
@@ -1,21 +1,21 @@
-from io import BytesIO
 from json import dumps
 
 import random
 import requests
+import struct
 import zmq
 
-from ecc import PrivateKey, S256Point, Signature
+from ecc import PrivateKey, S256Point, SchnorrSignature, Signature, sign_batch, verify_batch
 from helper import (
     decode_base58,
     double_sha256,
-    encode_varint,
     hash160,
     int_to_little_endian,
     little_endian_to_int,
     p2pkh_script,
     p2sh_script,
-    read_varint,
+    ByteCursor,
+    ByteWriter,
     SIGHASH_ALL,
 )
 from script import Script
@@ -57,6 +57,8 @@ class Tx(LibBitcoinClient):
     fee = 2500
     insight = 'https://btc-bitcore6.trezor.io/api'
     seeds = None
+    # whether the chain takes 64 byte Schnorr signatures, see BCHTx
+    schnorr = False
 
     def __init__(self, version, tx_ins, tx_outs, locktime, testnet=False):
         self.version = version
@@ -128,31 +130,31 @@ class Tx(LibBitcoinClient):
         response_code = little_endian_to_int(response[:4])
         if response_code != 0:
             raise RuntimeError('got code from server: {}'.format(response_code))
-        response = response[4:]
+        # 49 byte rows after the code, read in place
+        s = ByteCursor(response, 4)
         receives = []
         spent = set()
-        while len(response) > 0:
-            kind = response[0]
-            prev_tx = response[1:33]
-            prev_index = response[33:37]
-            block_height = little_endian_to_int(response[37:41])
-            if kind == 0:
-                value = little_endian_to_int(response[41:49])
-                if at_block_height is None or block_height <= at_block_height:
+        while s.remaining() > 0:
+            kind = s.read_u8()
+            prev_tx = s.read_bytes(32)
+            prev_index = s.read_u32le()
+            block_height = s.read_u32le()
+            # the value for a receive, the checksum of the output for a spend
+            value = s.read_u64le()
+            if at_block_height is None or block_height <= at_block_height:
+                if kind == 0:
                     receives.append([prev_tx, prev_index, value])
-            else:
-                if at_block_height is None or block_height <= at_block_height:
-                    spent.add(little_endian_to_int(response[41:49]))
-            response = response[49:]
+                else:
+                    spent.add(value)
         utxos = []
         tx_mask = 0xffffffffffff8000
         index_mask = 0x7fff
         for prev_tx, prev_index, value in receives:
             tx_upper_49_bits = (little_endian_to_int(prev_tx) >> 12*8) & tx_mask
-            index_lower_15_bits = little_endian_to_int(prev_index) & index_mask
+            index_lower_15_bits = prev_index & index_mask
             key = tx_upper_49_bits | index_lower_15_bits
             if key not in spent:
-                utxos.append([serialized_script_pubkey, prev_tx[::-1], little_endian_to_int(prev_index), value])
+                utxos.append([serialized_script_pubkey, prev_tx[::-1], prev_index, value])
         return utxos
 
     @classmethod
@@ -164,7 +166,7 @@ class Tx(LibBitcoinClient):
         return utxos
 
     @classmethod
-    def spend_tx(cls, wifs, utxos, destination_addr, fee=540, segwit=False):
+    def spend_tx(cls, wifs, utxos, destination_addr, fee=540, segwit=False, schnorr=False):
         destination_address_data = cls.get_address_data(destination_addr)
         testnet = destination_address_data['testnet']
         if testnet:
@@ -197,6 +199,7 @@ class Tx(LibBitcoinClient):
         script_pubkey = destination_address_data['script_pubkey']
         tx_out = TxOut(total - fee, script_pubkey.serialize())
         tx = cls(cls.default_version, tx_ins, [tx_out], 0, testnet=testnet)
+        signers = []
         for index, tx_in in enumerate(tx_ins):
             priv_key = priv_lookup[tx_in.script_pubkey().serialize()]
             if segwit:
@@ -204,19 +207,20 @@ class Tx(LibBitcoinClient):
                 redeem_script = Script([0, hash160(sec)]).serialize()
             else:
                 redeem_script = None
-            tx.sign_input(
+            signers.append((
                 index,
                 priv_key,
                 cls.default_hash_type,
-                compressed=priv_key.compressed,
-                redeem_script=redeem_script,
-            )
-        if not tx.verify():
+                priv_key.compressed,
+                redeem_script,
+            ))
+        # sign_inputs verifies every input it signs, which here is all of them
+        if not tx.sign_inputs(signers, schnorr=schnorr):
             raise RuntimeError('failed validation')
         return tx
 
     @classmethod
-    def spend_all_tx(cls, private_keys, destination_addr, fee, segwit, utxos):
+    def spend_all_tx(cls, private_keys, destination_addr, fee, segwit, utxos, schnorr=False):
         destination_address_data = cls.get_address_data(destination_addr)
         testnet = destination_address_data['testnet']
         if testnet:
@@ -266,6 +270,7 @@ class Tx(LibBitcoinClient):
         print('{}: {} to {}'.format(cls, (total - fee) / cls.scale, destination_addr))
         tx_out = TxOut(total - fee, script_pubkey.serialize())
         tx = cls(cls.default_version, tx_ins, [tx_out], 0, testnet=testnet)
+        signers = []
         for index, tx_in in enumerate(tx_ins):
             private_key = priv_lookup[tx_in.script_pubkey().serialize()]
             if segwit:
@@ -273,16 +278,16 @@ class Tx(LibBitcoinClient):
                 redeem_script = Script([0, hash160(sec)]).serialize()
             else:
                 redeem_script = None
-            if not tx.sign_input(
+            signers.append((
                 index,
                 private_key,
                 cls.default_hash_type,
-                compressed=private_key.compressed,
-                redeem_script=redeem_script,
-            ):
-                raise RuntimeError('sign and verify do different things')
-        if not tx.verify():
-            raise RuntimeError('failed validation')
+                private_key.compressed,
+                redeem_script,
+            ))
+        # sign_inputs verifies every input it signs, which here is all of them
+        if not tx.sign_inputs(signers, schnorr=schnorr):
+            raise RuntimeError('sign and verify do different things')
         return tx
 
     @classmethod
@@ -290,59 +295,73 @@ class Tx(LibBitcoinClient):
         '''Takes a byte stream and parses the transaction at the start
         return a Tx object
         '''
-        # s.read(n) will return n bytes
+        # a cursor reads straight out of bytes or a BytesIO's buffer, and
+        # wraps any other stream
+        cursor = ByteCursor.wrap(s)
+        try:
+            return cls.parse_from(cursor)
+        finally:
+            cursor.finish()
+
+    @classmethod
+    def parse_from(cls, s):
+        '''Same as parse, but s is a cursor already (see ByteCursor.wrap)'''
         # version has 4 bytes, little-endian, interpret as int
-        version = little_endian_to_int(s.read(4))
-        # num_inputs is a varint, use read_varint(s)
-        num_inputs = read_varint(s)
+        version = s.read_u32le()
+        # num_inputs is a varint, use s.read_varint()
+        num_inputs = s.read_varint()
         # if we have a segwit marker, we need to parse in another way
         if num_inputs == 0:
             return cls.parse_segwit(s, version)
         # each input needs parsing
         inputs = []
         for _ in range(num_inputs):
-            inputs.append(TxIn.parse(s))
-        # num_outputs is a varint, use read_varint(s)
-        num_outputs = read_varint(s)
+            inputs.append(TxIn.parse_from(s))
+        # num_outputs is a varint, use s.read_varint()
+        num_outputs = s.read_varint()
         # each output needs parsing
         outputs = []
         for _ in range(num_outputs):
-            outputs.append(TxOut.parse(s))
+            outputs.append(TxOut.parse_from(s))
         # locktime is 4 bytes, little-endian
-        locktime = little_endian_to_int(s.read(4))
+        locktime = s.read_u32le()
         # return an instance of the class (cls(...))
         return cls(version, inputs, outputs, locktime)
 
     @classmethod
     def parse_segwit(cls, s, version):
-        '''Takes a byte stream and parses the segwit transaction in middle
+        '''Takes the cursor parse_from is reading and parses the segwit
+        transaction in middle
         return a Tx object
         '''
-        marker = s.read(1)
-        if marker != b'\x01':
-            raise RuntimeError('Not a segwit transaction {}'.format(marker))
-        # num_inputs is a varint, use read_varint(s)
-        num_inputs = read_varint(s)
+        marker = s.read_u8()
+        if marker != 1:
+            raise RuntimeError('Not a segwit transaction {}'.format(bytes([marker])))
+        # num_inputs is a varint, use s.read_varint()
+        num_inputs = s.read_varint()
         # each input needs parsing
         tx_ins = []
         for _ in range(num_inputs):
-            tx_ins.append(TxIn.parse(s))
-        # num_outputs is a varint, use read_varint(s)
-        num_outputs = read_varint(s)
+            tx_ins.append(TxIn.parse_from(s))
+        # num_outputs is a varint, use s.read_varint()
+        num_outputs = s.read_varint()
         # each output needs parsing
         tx_outs = []
         for _ in range(num_outputs):
-            tx_outs.append(TxOut.parse(s))
+            tx_outs.append(TxOut.parse_from(s))
         # now parse the witness program
         for tx_in in tx_ins:
-            num_elements = read_varint(s)
-            elements = [num_elements]
+            num_elements = s.read_varint()
+            # serialized the way Script([num_elements, *elements]) would
+            # be, straight into one bytearray
+            witness = bytearray([num_elements])
             for _ in range(num_elements):
-                element_len = read_varint(s)
-                elements.append(s.read(element_len))
-            tx_in.witness_program = Script(elements).serialize()
+                element = s.read_varbytes()
+                witness.append(len(element))
+                witness += element
+            tx_in.witness_program = bytes(witness)
         # locktime is 4 bytes, little-endian
-        locktime = little_endian_to_int(s.read(4))
+        locktime = s.read_u32le()
         # return an instance of the class (cls(...))
         return cls(version, tx_ins, tx_outs, locktime)
 
@@ -354,50 +373,62 @@ class Tx(LibBitcoinClient):
 
     def serialize(self):
         '''Returns the byte serialization of the transaction'''
+        writer = ByteWriter()
+        self.serialize_into(writer)
+        return writer.getvalue()
+
+    def serialize_segwit(self):
+        '''Returns the byte serialization of the transaction'''
+        writer = ByteWriter()
+        self.serialize_segwit_into(writer)
+        return writer.getvalue()
+
+    def serialize_into(self, writer):
+        '''Writes the byte serialization of the transaction to the
+        ByteWriter writer'''
         if self.is_segwit():
-            return self.serialize_segwit()
+            return self.serialize_segwit_into(writer)
         # serialize version (4 bytes, little endian)
-        result = int_to_little_endian(self.version, 4)
-        # encode_varint on the number of inputs
-        result += encode_varint(len(self.tx_ins))
+        writer.write_u32le(self.version)
+        # varint on the number of inputs
+        writer.write_varint(len(self.tx_ins))
         # iterate inputs
         for tx_in in self.tx_ins:
             # serialize each input
-            result += tx_in.serialize()
-        # encode_varint on the number of inputs
-        result += encode_varint(len(self.tx_outs))
+            tx_in.serialize_into(writer)
+        # varint on the number of outputs
+        writer.write_varint(len(self.tx_outs))
         # iterate outputs
         for tx_out in self.tx_outs:
             # serialize each output
-            result += tx_out.serialize()
+            tx_out.serialize_into(writer)
         # serialize locktime (4 bytes, little endian)
-        result += int_to_little_endian(self.locktime, 4)
-        return result
+        writer.write_u32le(self.locktime)
 
-    def serialize_segwit(self):
-        '''Returns the byte serialization of the transaction'''
+    def serialize_segwit_into(self, writer):
+        '''Writes the segwit byte serialization of the transaction to the
+        ByteWriter writer'''
         # serialize version (4 bytes, little endian)
-        result = int_to_little_endian(self.version, 4)
+        writer.write_u32le(self.version)
         # segwit marker '0001'
-        result += b'\x00\x01'
-        # encode_varint on the number of inputs
-        result += encode_varint(len(self.tx_ins))
+        writer.write(b'\x00\x01')
+        # varint on the number of inputs
+        writer.write_varint(len(self.tx_ins))
         # iterate inputs
         for tx_in in self.tx_ins:
             # serialize each input
-            result += tx_in.serialize()
-        # encode_varint on the number of inputs
-        result += encode_varint(len(self.tx_outs))
+            tx_in.serialize_into(writer)
+        # varint on the number of outputs
+        writer.write_varint(len(self.tx_outs))
         # iterate outputs
         for tx_out in self.tx_outs:
             # serialize each output
-            result += tx_out.serialize()
+            tx_out.serialize_into(writer)
         # add the witness data
         for tx_in in self.tx_ins:
-            result += tx_in.witness_program
+            writer.write(tx_in.witness_program)
         # serialize locktime (4 bytes, little endian)
-        result += int_to_little_endian(self.locktime, 4)
-        return result
+        writer.write_u32le(self.locktime)
 
     def fee(self):
         '''Returns the fee of this transaction in satoshi'''
@@ -416,13 +447,13 @@ class Tx(LibBitcoinClient):
 
     def hash_prevouts(self):
         if self._hash_prevouts is None:
-            all_prevouts = b''
-            all_sequence = b''
+            all_prevouts = ByteWriter()
+            all_sequence = ByteWriter()
             for tx_in in self.tx_ins:
-                all_prevouts += tx_in.prev_tx[::-1] + int_to_little_endian(tx_in.prev_index, 4)
-                all_sequence += int_to_little_endian(tx_in.sequence, 4)
-            self._hash_prevouts = double_sha256(all_prevouts)
-            self._hash_sequence = double_sha256(all_sequence)
+                tx_in.serialize_outpoint_into(all_prevouts)
+                all_sequence.write_u32le(tx_in.sequence)
+            self._hash_prevouts = double_sha256(all_prevouts.data)
+            self._hash_sequence = double_sha256(all_sequence.data)
         return self._hash_prevouts
 
     def hash_sequence(self):
@@ -432,10 +463,10 @@ class Tx(LibBitcoinClient):
 
     def hash_outputs(self):
         if self._hash_outputs is None:
-            all_outputs = b''
+            all_outputs = ByteWriter()
             for tx_out in self.tx_outs:
-                all_outputs += tx_out.serialize()
-            self._hash_outputs = double_sha256(all_outputs)
+                tx_out.serialize_into(all_outputs)
+            self._hash_outputs = double_sha256(all_outputs.data)
         return self._hash_outputs
 
     def sig_hash_preimage_bip143(self, input_index, hash_type, redeem_script=None):
@@ -500,17 +531,20 @@ class Tx(LibBitcoinClient):
             locktime=self.locktime,
         )
         # add the hash_type
-        result = alt_tx.serialize()
-        result += int_to_little_endian(hash_type, 4)
-        return int.from_bytes(double_sha256(result), 'big')
-
-    def verify_input(self, input_index):
-        '''Returns whether the input has a valid signature'''
+        writer = ByteWriter()
+        alt_tx.serialize_into(writer)
+        writer.write_u32le(hash_type)
+        return int.from_bytes(double_sha256(writer.data), 'big')
+
+    def input_signatures(self, input_index):
+        '''Returns the (point, z, signature) checks the input needs to pass,
+        or None if the input can't be valid whatever the signatures are'''
         # get the relevant input
         tx_in = self.tx_ins[input_index]
         # get the number of signatures required. This is available in tx_in.script_sig.num_sigs_required()
         sigs_required = tx_in.script_sig.num_sigs_required()
-        # iterate over the sigs required and check each signature
+        checks = []
+        # iterate over the sigs required and collect each signature
         for sig_num in range(sigs_required):
             # get the point from the sec format
             sec = tx_in.sec_pubkey(index=sig_num)
@@ -525,32 +559,37 @@ class Tx(LibBitcoinClient):
             if tx_in.is_segwit():
                 h160 = hash160(tx_in.script_sig.redeem_script())
                 if h160 != tx_in.script_pubkey(self.testnet).elements[1]:
-                    return False
+                    return None
                 pubkey_h160 = tx_in.script_sig.redeem_script()[-20:]
                 if pubkey_h160 != point.h160():
-                    return False
+                    return None
                 z = self.sig_hash_bip143(input_index, hash_type)
             else:
                 z = self.sig_hash(input_index, hash_type)
-            # use point.verify on the hash to sign and signature
+            checks.append((point, z, signature))
+        return checks
+
+    def verify_input(self, input_index):
+        '''Returns whether the input has a valid signature'''
+        checks = self.input_signatures(input_index)
+        if checks is None:
+            return False
+        # use point.verify on the hash to sign and signature
+        for point, z, signature in checks:
             if not point.verify(z, signature):
                 return False
         return True
 
-    def sign_input(self, input_index, private_key, hash_type, compressed=True, redeem_script=None):
-        '''Signs the input using the private key'''
-        # get the hash to sign
-        tx_in = self.tx_ins[input_index]
+    def signing_hash(self, input_index, hash_type, redeem_script=None):
+        '''Returns the hash that sign_input signs for the input'''
         if redeem_script:
-            z = self.sig_hash_bip143(input_index, hash_type, redeem_script=redeem_script)
+            return self.sig_hash_bip143(input_index, hash_type, redeem_script=redeem_script)
         else:
-            z = self.sig_hash(input_index, hash_type)
-        # get der signature of z from private key
-        der = private_key.sign(z).der()
-        # append the hash_type to der (use bytes([hash_type]))
-        sig = der + bytes([hash_type])
-        # calculate the sec
-        sec = private_key.point.sec(compressed=compressed)
+            return self.sig_hash(input_index, hash_type)
+
+    def set_signature(self, input_index, sig, sec, redeem_script=None):
+        '''Puts the signature (with hash_type) and sec into the input'''
+        tx_in = self.tx_ins[input_index]
         if redeem_script:
             # witness program 0
             tx_in.script_sig = Script([redeem_script])
@@ -559,9 +598,54 @@ class Tx(LibBitcoinClient):
             # initialize a new script with [sig, sec] as the elements
             # change input's script_sig to new script
             tx_in.script_sig = Script([sig, sec])
+
+    def sign_input(self, input_index, private_key, hash_type, compressed=True, redeem_script=None):
+        '''Signs the input using the private key'''
+        # get the hash to sign
+        z = self.signing_hash(input_index, hash_type, redeem_script=redeem_script)
+        # get der signature of z from private key
+        der = private_key.sign(z).der()
+        # append the hash_type to der (use bytes([hash_type]))
+        sig = der + bytes([hash_type])
+        # calculate the sec
+        sec = private_key.point.sec(compressed=compressed)
+        self.set_signature(input_index, sig, sec, redeem_script=redeem_script)
         # return whether sig is valid using self.verify_input
         return self.verify_input(input_index)
 
+    def sign_inputs(self, signers, schnorr=False):
+        '''Signs several inputs at once. signers is a list of
+        (input_index, private_key, hash_type, compressed, redeem_script),
+        the arguments of sign_input. All of them get Schnorr signatures
+        if schnorr is True, for the chains that take them (see BCHTx).
+        Returns whether all of them verify.'''
+        if schnorr and not self.schnorr:
+            raise RuntimeError('{} has no Schnorr signatures'.format(
+                self.__class__.__name__))
+        # the hashes to sign don't depend on the other inputs' signatures,
+        # so they can all be computed first and then signed together
+        zs = [
+            self.signing_hash(input_index, hash_type, redeem_script=redeem_script)
+            for input_index, _, hash_type, _, redeem_script in signers
+        ]
+        if schnorr:
+            signatures = [
+                signer[1].sign_schnorr(z).serialize() for signer, z in zip(signers, zs)]
+        else:
+            signatures = [signature.der() for signature in sign_batch([
+                (signer[1], z) for signer, z in zip(signers, zs)])]
+        checks = []
+        for signer, signature in zip(signers, signatures):
+            input_index, private_key, hash_type, compressed, redeem_script = signer
+            sig = signature + bytes([hash_type])
+            sec = private_key.point.sec(compressed=compressed)
+            self.set_signature(input_index, sig, sec, redeem_script=redeem_script)
+            input_checks = self.input_signatures(input_index)
+            if input_checks is None:
+                return False
+            checks.extend(input_checks)
+        return not verify_batch(checks)
+
     def is_coinbase(self):
         '''Returns whether this transaction is a coinbase transaction or not'''
         # check that there is exactly 1 input
@@ -592,20 +676,22 @@ class Tx(LibBitcoinClient):
         return little_endian_to_int(first_element)
 
     def verify(self):
+        # collect the signatures of every input and check them together
+        checks = []
         for i in range(len(self.tx_ins)):
-            if not self.verify_input(i):
+            input_checks = self.input_signatures(i)
+            if input_checks is None:
                 return False
-        return True
+            checks.extend(input_checks)
+        return not verify_batch(checks)
 
-    def sign(self, private_key, compressed=True):
-        for i in range(len(self.tx_ins)):
-            if not self.sign_input(
-                    i,
-                    private_key,
-                    self.default_hash_type,
-                    compressed=compressed,
-            ):
-                raise RuntimeError('signing failed')
+    def sign(self, private_key, compressed=True, schnorr=False):
+        signers = [
+            (i, private_key, self.default_hash_type, compressed, None)
+            for i in range(len(self.tx_ins))
+        ]
+        if not self.sign_inputs(signers, schnorr=schnorr):
+            raise RuntimeError('signing failed')
 
     def send_insight(self):
         if self.insight is None:
@@ -696,29 +782,25 @@ class BTCPTx(Tx):
             locktime=self.locktime,
         )
         # add the hash_type
-        result = alt_tx.serialize()
-        result += int_to_little_endian(hash_type | self.fork_id, 4)
-        return int.from_bytes(double_sha256(result), 'big')
+        writer = ByteWriter()
+        alt_tx.serialize_into(writer)
+        writer.write_u32le(hash_type | self.fork_id)
+        return int.from_bytes(double_sha256(writer.data), 'big')
 
-    def sign_input(self, input_index, private_key, hash_type, compressed=True, redeem_script=None):
-        '''Signs the input using the private key'''
-        # get the hash to sign
-        tx_in = self.tx_ins[input_index]
+    def signing_hash(self, input_index, hash_type, redeem_script=None):
+        '''Returns the hash that sign_input signs for the input'''
         if redeem_script:
             h160 = Script.parse(redeem_script).elements[1]
-            tx_in._script_pubkey = Script.parse(p2pkh_script(h160))
-        z = self.sig_hash(input_index, hash_type)
-        # get der signature of z from private key
-        der = private_key.sign(z).der()
-        # append the hash_type to der (use bytes([hash_type]))
-        sig = der + bytes([hash_type])
-        # calculate the sec
-        sec = private_key.point.sec(compressed=compressed)
+            self.tx_ins[input_index]._script_pubkey = Script.parse(p2pkh_script(h160))
+        return self.sig_hash(input_index, hash_type)
+
+    def set_signature(self, input_index, sig, sec, redeem_script=None):
+        '''Puts the signature (with hash_type) and sec into the input'''
+        tx_in = self.tx_ins[input_index]
         if redeem_script:
             tx_in.script_sig = Script([sig, sec, redeem_script])
         else:
             tx_in.script_sig = Script([sig, sec])
-        return self.verify_input(input_index)
 
 
 class B2XTx(ForkTx):
@@ -765,9 +847,10 @@ class B2XTx(ForkTx):
             locktime=self.locktime,
         )
         # add the hash_type
-        result = alt_tx.serialize()
-        result += int_to_little_endian(hash_type << 1, 4)
-        return int.from_bytes(double_sha256(result), 'big')
+        writer = ByteWriter()
+        alt_tx.serialize_into(writer)
+        writer.write_u32le(hash_type << 1)
+        return int.from_bytes(double_sha256(writer.data), 'big')
 
     def sig_hash_preimage_bip143(self, input_index, hash_type, redeem_script=None):
         '''Returns the integer representation of the hash that needs to get
@@ -811,6 +894,7 @@ class BCHTx(ForkTx):
     default_hash_type = 0x41
     insight = 'https://bch-bitcore2.trezor.io/api'
     fee = 540
+    schnorr = True
 
     def sig_hash_preimage_bip143(self, input_index, hash_type, redeem_script=None):
         '''Returns the integer representation of the hash that needs to get
@@ -836,8 +920,8 @@ class BCHTx(ForkTx):
         s += int_to_little_endian(hash_type | self.fork_id, 4)
         return s
 
-    def verify_input(self, input_index):
-        '''Returns whether the input has a valid signature'''
+    def input_signatures(self, input_index):
+        '''Returns the (point, z, signature) checks the input needs to pass'''
         # get the relevant input
         tx_in = self.tx_ins[input_index]
         # get the sec_pubkey at current signature index
@@ -845,39 +929,42 @@ class BCHTx(ForkTx):
         # get the der sig and hash_type from input
         # get the der_signature at current signature index
         der, hash_type = tx_in.der_signature()
-        # get the signature from der format
-        signature = Signature.parse(der)
+        # 64 bytes is a Schnorr signature, anything else is DER
+        if self.schnorr and len(der) == 64:
+            signature = SchnorrSignature.parse(der)
+        else:
+            signature = Signature.parse(der)
         # get the hash to sign
         z = self.sig_hash_bip143(input_index, hash_type)
-        # use point.verify on the hash to sign and signature
-        if not point.verify(z, signature):
-            return False
-        return True
+        return [(point, z, signature)]
 
-    def sign_input(self, input_index, private_key, hash_type, compressed=True, redeem_script=None):
-        '''Signs the input using the private key'''
-        # get the hash to sign
-        z = self.sig_hash_bip143(input_index, hash_type)
-        # get der signature of z from private key
-        der = private_key.sign(z).der()
-        # append the hash_type to der (use bytes([hash_type]))
-        sig = der + bytes([hash_type])
-        # calculate the sec
-        sec = private_key.point.sec(compressed=compressed)
+    def signing_hash(self, input_index, hash_type, redeem_script=None):
+        '''Returns the hash that sign_input signs for the input'''
+        return self.sig_hash_bip143(input_index, hash_type)
+
+    def set_signature(self, input_index, sig, sec, redeem_script=None):
+        '''Puts the signature (with hash_type) and sec into the input'''
         # initialize a new script with [sig, sec] as the elements
-        script_sig = Script([sig, sec])
         # change input's script_sig to new script
-        self.tx_ins[input_index].script_sig = script_sig
-        # return whether sig is valid using self.verify_input
+        self.tx_ins[input_index].script_sig = Script([sig, sec])
+
+    def sign_input(self, input_index, private_key, hash_type, compressed=True, redeem_script=None, schnorr=False):
+        '''Signs the input using the private key, with a Schnorr signature
+        instead of ECDSA if schnorr is True. verify_input and verify tell
+        them apart by their length, and verify checks all the Schnorr
+        signatures of the transaction with a single multi_mul.'''
+        if schnorr and not self.schnorr:
+            raise RuntimeError('{} has no Schnorr signatures'.format(
+                self.__class__.__name__))
+        if not schnorr:
+            return super().sign_input(
+                input_index, private_key, hash_type, compressed, redeem_script)
+        z = self.signing_hash(input_index, hash_type, redeem_script=redeem_script)
+        sig = private_key.sign_schnorr(z).serialize() + bytes([hash_type])
+        sec = private_key.point.sec(compressed=compressed)
+        self.set_signature(input_index, sig, sec, redeem_script=redeem_script)
         return self.verify_input(input_index)
 
-    def sign(self, private_key, compressed=True):
-        hash_type = self.default_hash_type
-        for i in range(len(self.tx_ins)):
-            if not self.sign_input(
-                    i, private_key, hash_type, compressed=compressed):
-                raise RuntimeError('signing failed')
-
 
 class BTGTx(BCHTx):
     fork_block = 491407
@@ -886,28 +973,15 @@ class BTGTx(BCHTx):
     p2sh_prefixes = (b'\x17', b'\xc4', b'\x05')
     insight = 'https://btg-bitcore2.trezor.io/api'
     fee = 5000
+    # Bitcoin Gold and the forks below built on it never took Schnorr
+    schnorr = False
 
-    def sign_input(self, input_index, private_key, hash_type, compressed=True, redeem_script=None):
-        '''Signs the input using the private key'''
-        # get the hash to sign
-        z = self.sig_hash_bip143(input_index, hash_type, redeem_script=redeem_script)
-        # get der signature of z from private key
-        der = private_key.sign(z).der()
-        # append the hash_type to der (use bytes([hash_type]))
-        sig = der + bytes([hash_type])
-        # calculate the sec
-        sec = private_key.point.sec(compressed=compressed)
-        tx_in = self.tx_ins[input_index]
-        if redeem_script:
-            tx_in.script_sig = Script([redeem_script])
-            tx_in.witness_program = Script([2, sig, sec]).serialize()
-        else:
-            # initialize a new script with [sig, sec] as the elements
-            script_sig = Script([sig, sec])
-            # change input's script_sig to new script
-            tx_in.script_sig = script_sig
-        # return whether sig is valid using self.verify_input
-        return self.verify_input(input_index)
+    def signing_hash(self, input_index, hash_type, redeem_script=None):
+        '''Returns the hash that sign_input signs for the input'''
+        return self.sig_hash_bip143(input_index, hash_type, redeem_script=redeem_script)
+
+    # the signature goes in the witness like with Tx, not like BCHTx
+    set_signature = Tx.set_signature
 
 
 class BCITx(BTGTx):
@@ -977,67 +1051,15 @@ class BTVTx(BTGTx):
             locktime=self.locktime,
         )
         # add the hash_type
-        result = alt_tx.serialize()
-        result += int_to_little_endian(hash_type | self.fork_id, 4)
-        return int.from_bytes(double_sha256(result), 'big')
-
-    def sign_input(self, input_index, private_key, hash_type, compressed=True, redeem_script=None):
-        '''Signs the input using the private key'''
-        # get the hash to sign
-        tx_in = self.tx_ins[input_index]
-        if redeem_script:
-            z = self.sig_hash_bip143(input_index, hash_type, redeem_script=redeem_script)
-        else:
-            z = self.sig_hash(input_index, hash_type)
-        # get der signature of z from private key
-        der = private_key.sign(z).der()
-        # append the hash_type to der (use bytes([hash_type]))
-        sig = der + bytes([hash_type])
-        # calculate the sec
-        sec = private_key.point.sec(compressed=compressed)
-        if redeem_script:
-            # witness program 0
-            tx_in.script_sig = Script([redeem_script])
-            tx_in.witness_program = Script([2, sig, sec]).serialize()
-        else:
-            # initialize a new script with [sig, sec] as the elements
-            # change input's script_sig to new script
-            tx_in.script_sig = Script([sig, sec])
-        # return whether sig is valid using self.verify_input
-        return self.verify_input(input_index)
+        writer = ByteWriter()
+        alt_tx.serialize_into(writer)
+        writer.write_u32le(hash_type | self.fork_id)
+        return int.from_bytes(double_sha256(writer.data), 'big')
 
-    def verify_input(self, input_index):
-        '''Returns whether the input has a valid signature'''
-        # get the relevant input
-        tx_in = self.tx_ins[input_index]
-        # get the number of signatures required. This is available in tx_in.script_sig.num_sigs_required()
-        sigs_required = tx_in.script_sig.num_sigs_required()
-        # iterate over the sigs required and check each signature
-        for sig_num in range(sigs_required):
-            # get the point from the sec format
-            sec = tx_in.sec_pubkey(index=sig_num)
-            # get the sec_pubkey at current signature index
-            point = S256Point.parse(sec)
-            # get the der sig and hash_type from input
-            # get the der_signature at current signature index
-            der, hash_type = tx_in.der_signature(index=sig_num)
-            # get the signature from der format
-            signature = Signature.parse(der)
-            # get the hash to sign
-            if tx_in.is_segwit():
-                h160 = hash160(tx_in.script_sig.redeem_script())
-                if h160 != tx_in.script_pubkey(self.testnet).elements[1]:
-                    return False
-                pubkey_h160 = tx_in.script_sig.redeem_script()[-20:]
-                if pubkey_h160 != point.h160():
-                    return False
-                z = self.sig_hash_bip143(input_index, hash_type)
-            else:
-                z = self.sig_hash(input_index, hash_type)
-            # use point.verify on the hash to sign and signature
-            if not point.verify(z, signature):
-                return False
-        return True
+    # signed and checked like Tx, with sig_hash unless there's a redeem
+    # script, not always with sig_hash_bip143 like BCHTx
+    signing_hash = Tx.signing_hash
+    input_signatures = Tx.input_signatures
 
 
 class BCA(BTGTx):
@@ -1110,81 +1132,78 @@ class BCDTx(ForkTx):
             self.prev_block_hash = prev_block_hash
 
     @classmethod
-    def parse(cls, s):
-        '''Takes a byte stream and parses the transaction at the start
-        return a Tx object
-        '''
-        # s.read(n) will return n bytes
+    def parse_from(cls, s):
+        '''Same as parse, but s is a cursor already (see ByteCursor.wrap)'''
         # version has 4 bytes, little-endian, interpret as int
-        version = little_endian_to_int(s.read(4))
-        prev_block_hash = s.read(32)[::-1]
-        # num_inputs is a varint, use read_varint(s)
-        num_inputs = read_varint(s)
+        version = s.read_u32le()
+        prev_block_hash = s.read_hash()
+        # num_inputs is a varint, use s.read_varint()
+        num_inputs = s.read_varint()
         # each input needs parsing
         inputs = []
         for _ in range(num_inputs):
-            inputs.append(TxIn.parse(s))
-        # num_outputs is a varint, use read_varint(s)
-        num_outputs = read_varint(s)
+            inputs.append(TxIn.parse_from(s))
+        # num_outputs is a varint, use s.read_varint()
+        num_outputs = s.read_varint()
         # each output needs parsing
         outputs = []
         for _ in range(num_outputs):
-            outputs.append(TxOut.parse(s))
+            outputs.append(TxOut.parse_from(s))
         # locktime is 4 bytes, little-endian
-        locktime = little_endian_to_int(s.read(4))
+        locktime = s.read_u32le()
         # return an instance of the class (cls(...))
         return cls(version, inputs, outputs, locktime, prev_block_hash=prev_block_hash)
 
-    def serialize_segwit(self):
-        '''Returns the byte serialization of the transaction'''
+    def serialize_into(self, writer):
+        '''Writes the byte serialization of the transaction to the
+        ByteWriter writer'''
+        if self.is_segwit():
+            return self.serialize_segwit_into(writer)
         # serialize version (4 bytes, little endian)
-        result = int_to_little_endian(self.version, 4)
+        writer.write_u32le(self.version)
         # previous block hash
-        result += self.prev_block_hash[::-1]
-        # segwit marker '0001'
-        result += b'\x00\x01'
-        # encode_varint on the number of inputs
-        result += encode_varint(len(self.tx_ins))
+        writer.write_hash(self.prev_block_hash)
+        # varint on the number of inputs
+        writer.write_varint(len(self.tx_ins))
         # iterate inputs
         for tx_in in self.tx_ins:
             # serialize each input
-            result += tx_in.serialize()
-        # encode_varint on the number of inputs
-        result += encode_varint(len(self.tx_outs))
+            tx_in.serialize_into(writer)
+        # varint on the number of outputs
+        writer.write_varint(len(self.tx_outs))
         # iterate outputs
         for tx_out in self.tx_outs:
             # serialize each output
-            result += tx_out.serialize()
-        # add the witness data
-        for tx_in in self.tx_ins:
-            result += tx_in.witness_program
+            tx_out.serialize_into(writer)
         # serialize locktime (4 bytes, little endian)
-        result += int_to_little_endian(self.locktime, 4)
-        return result
+        writer.write_u32le(self.locktime)
 
-    def serialize(self):
-        '''Returns the byte serialization of the transaction'''
-        if self.is_segwit():
-            return self.serialize_segwit()
+    def serialize_segwit_into(self, writer):
+        '''Writes the segwit byte serialization of the transaction to the
+        ByteWriter writer'''
         # serialize version (4 bytes, little endian)
-        result = int_to_little_endian(self.version, 4)
+        writer.write_u32le(self.version)
         # previous block hash
-        result += self.prev_block_hash[::-1]
-        # encode_varint on the number of inputs
-        result += encode_varint(len(self.tx_ins))
+        writer.write_hash(self.prev_block_hash)
+        # segwit marker '0001'
+        writer.write(b'\x00\x01')
+        # varint on the number of inputs
+        writer.write_varint(len(self.tx_ins))
         # iterate inputs
         for tx_in in self.tx_ins:
             # serialize each input
-            result += tx_in.serialize()
-        # encode_varint on the number of inputs
-        result += encode_varint(len(self.tx_outs))
+            tx_in.serialize_into(writer)
+        # varint on the number of outputs
+        writer.write_varint(len(self.tx_outs))
         # iterate outputs
         for tx_out in self.tx_outs:
             # serialize each output
-            result += tx_out.serialize()
+            tx_out.serialize_into(writer)
+        # add the witness data
+        for tx_in in self.tx_ins:
+            writer.write(tx_in.witness_program)
         # serialize locktime (4 bytes, little endian)
-        result += int_to_little_endian(self.locktime, 4)
-        return result
+        writer.write_u32le(self.locktime)
 
     def sig_hash_preimage_bip143(self, input_index, hash_type, redeem_script=None):
         '''Returns the integer representation of the hash that needs to get
@@ -1246,9 +1265,10 @@ class BCDTx(ForkTx):
             prev_block_hash=self.prev_block_hash,
         )
         # add the hash_type
-        result = alt_tx.serialize()
-        result += int_to_little_endian(hash_type, 4)
-        return int.from_bytes(double_sha256(result), 'big')
+        writer = ByteWriter()
+        alt_tx.serialize_into(writer)
+        writer.write_u32le(hash_type)
+        return int.from_bytes(double_sha256(writer.data), 'big')
 
 
 class SBTCTx(ForkTx):
@@ -1321,19 +1341,25 @@ class SBTCTx(ForkTx):
             locktime=self.locktime,
         )
         # add the hash_type
-        result = alt_tx.serialize()
-        result += int_to_little_endian(hash_type, 4)
-        result += self.sighash_append
-        return int.from_bytes(double_sha256(result), 'big')
+        writer = ByteWriter()
+        alt_tx.serialize_into(writer)
+        writer.write_u32le(hash_type)
+        writer.write(self.sighash_append)
+        return int.from_bytes(double_sha256(writer.data), 'big')
 
-    def sign(self, private_key, compressed=True):
+    def sign(self, private_key, compressed=True, schnorr=False):
         hash_type = 0x40 | SIGHASH_ALL
-        for i in range(len(self.tx_ins)):
-            if not self.sign_input(i, private_key, hash_type, compressed=compressed):
-                raise RuntimeError('signing failed')
+        signers = [
+            (i, private_key, hash_type, compressed, None)
+            for i in range(len(self.tx_ins))
+        ]
+        if not self.sign_inputs(signers, schnorr=schnorr):
+            raise RuntimeError('signing failed')
 
 
 class TxIn(LibBitcoinClient):
+    # prev_tx and prev_index, read together
+    outpoint = struct.Struct('<32sI')
 
     def __init__(self, prev_tx, prev_index, script_sig, sequence, witness_program=b'\x00', value=None, script_pubkey=None):
         self.prev_tx = prev_tx
@@ -1355,35 +1381,52 @@ class TxIn(LibBitcoinClient):
         '''Takes a byte stream and parses the tx_input at the start
         return a TxIn object
         '''
-        # s.read(n) will return n bytes
+        cursor = ByteCursor.wrap(s)
+        try:
+            return cls.parse_from(cursor)
+        finally:
+            cursor.finish()
+
+    @classmethod
+    def parse_from(cls, s):
+        '''Same as parse, but s is a cursor already (see ByteCursor.wrap)'''
         # prev_tx is 32 bytes, little endian
-        prev_tx = s.read(32)[::-1]
         # prev_index is 4 bytes, little endian, interpret as int
-        prev_index = little_endian_to_int(s.read(4))
+        prev_tx, prev_index = s.unpack(cls.outpoint)
+        prev_tx = prev_tx[::-1]
         # script_sig is a variable field (length followed by the data)
-        # get the length by using read_varint(s)
-        script_sig_length = read_varint(s)
-        script_sig = s.read(script_sig_length)
+        # s.read_varbytes() reads both
+        script_sig = s.read_varbytes()
         # sequence is 4 bytes, little-endian, interpret as int
-        sequence = little_endian_to_int(s.read(4))
+        sequence = s.read_u32le()
         # return an instance of the class (cls(...))
         return cls(prev_tx, prev_index, script_sig, sequence)
 
     def serialize(self):
         '''Returns the byte serialization of the transaction input'''
+        writer = ByteWriter()
+        self.serialize_into(writer)
+        return writer.getvalue()
+
+    def serialize_into(self, writer):
+        '''Writes the byte serialization of the transaction input to the
+        ByteWriter writer'''
+        self.serialize_outpoint_into(writer)
+        # the scriptSig with the varint of its length in front
+        writer.write_prefixed(self.script_sig)
+        # serialize sequence, 4 bytes, little endian
+        writer.write_u32le(self.sequence)
+
+    def serialize_outpoint_into(self, writer):
+        '''Writes prev_tx and prev_index to the ByteWriter writer'''
+        # the struct would pad a short hash with zeros or cut a long one,
+        # which makes a different txid instead of an error
+        if len(self.prev_tx) != 32:
+            raise RuntimeError('prev_tx should be 32 bytes, not {}'.format(
+                len(self.prev_tx)))
         # serialize prev_tx, little endian
-        result = self.prev_tx[::-1]
         # serialize prev_index, 4 bytes, little endian
-        result += int_to_little_endian(self.prev_index, 4)
-        # get the scriptSig ready (use self.script_sig.serialize())
-        raw_script_sig = self.script_sig.serialize()
-        # encode_varint on the length of the scriptSig
-        result += encode_varint(len(raw_script_sig))
-        # add the scriptSig
-        result += raw_script_sig
-        # serialize sequence, 4 bytes, little endian
-        result += int_to_little_endian(self.sequence, 4)
-        return result
+        writer.pack(self.outpoint, self.prev_tx[::-1], self.prev_index)
 
     def fetch_tx(self, testnet=False):
         if self.prev_tx not in self.cache:
@@ -1402,8 +1445,7 @@ class TxIn(LibBitcoinClient):
             response_code = little_endian_to_int(response_tx[:4])
             if response_code != 0:
                 raise RuntimeError('got code from server: {}'.format(response_code))
-            stream = BytesIO(response_tx[4:])
-            self.cache[self.prev_tx] = Tx.parse(stream)
+            self.cache[self.prev_tx] = Tx.parse(ByteCursor(response_tx, 4))
         return self.cache[self.prev_tx]
 
     def value(self, testnet=False):
@@ -1477,24 +1519,33 @@ class TxOut:
         '''Takes a byte stream and parses the tx_output at the start
         return a TxOut object
         '''
-        # s.read(n) will return n bytes
+        cursor = ByteCursor.wrap(s)
+        try:
+            return cls.parse_from(cursor)
+        finally:
+            cursor.finish()
+
+    @classmethod
+    def parse_from(cls, s):
+        '''Same as parse, but s is a cursor already (see ByteCursor.wrap)'''
         # amount is 8 bytes, little endian, interpret as int
-        amount = little_endian_to_int(s.read(8))
+        amount = s.read_u64le()
         # script_pubkey is a variable field (length followed by the data)
-        # get the length by using read_varint(s)
-        script_pubkey_length = read_varint(s)
-        script_pubkey = s.read(script_pubkey_length)
+        # s.read_varbytes() reads both
+        script_pubkey = s.read_varbytes()
         # return an instance of the class (cls(...))
         return cls(amount, script_pubkey)
 
     def serialize(self):
         '''Returns the byte serialization of the transaction output'''
+        writer = ByteWriter()
+        self.serialize_into(writer)
+        return writer.getvalue()
+
+    def serialize_into(self, writer):
+        '''Writes the byte serialization of the transaction output to the
+        ByteWriter writer'''
         # serialize amount, 8 bytes, little endian
-        result = int_to_little_endian(self.amount, 8)
-        # get the scriptPubkey ready (use self.script_pubkey.serialize())
-        raw_script_pubkey = self.script_pubkey.serialize()
-        # encode_varint on the length of the scriptPubkey
-        result += encode_varint(len(raw_script_pubkey))
-        # add the scriptPubKey
-        result += raw_script_pubkey
-        return result
+        writer.write_u64le(self.amount)
+        # the scriptPubKey with the varint of its length in front
+        writer.write_prefixed(self.script_pubkey)
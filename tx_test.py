@@ -4,12 +4,16 @@ from unittest import TestCase
 
 from ecc import PrivateKey, S256Point, Signature
 from helper import (
+    ByteCursor,
+    ByteWriter,
+    encode_varint,
     hash160,
+    int_to_little_endian,
     p2pkh_script,
     SIGHASH_ALL,
 )
 from script import Script
-from tx import Tx, TxIn, TxOut, BCDTx, BTGTx, SBTCTx, BCHTx, BTCPTx
+from tx import Tx, TxIn, TxOut, BCDTx, BTGTx, BTVTx, SBTCTx, BCHTx, BTCPTx
 
 
 class TxTest(TestCase):
@@ -171,6 +175,102 @@ class TxTest(TestCase):
         )
         self.assertTrue(tx.sign_input(0, private_key, SIGHASH_ALL))
 
+    def test_sign_inputs(self):
+        private_keys = [PrivateKey(secret=8675309), PrivateKey(secret=8675310)]
+        prev_tx = unhexlify('0025bc3c0fa8b7eb55b9437fdbd016870d18e0df0ace7bc9864efc38414147c8')
+        h160 = Tx.get_address_data('mzx5YhAH9kNHtcN481u6WkjeHjYtVeKVh2')['h160']
+        for tx_class in (Tx, BCHTx):
+            txs = []
+            for _ in range(2):
+                tx_ins = []
+                for i in range(3):
+                    tx_in = TxIn(prev_tx, i, b'', 0xffffffff)
+                    tx_in._value = 10000000
+                    tx_in._script_pubkey = Script.parse(
+                        private_keys[i % 2].point.p2pkh_script())
+                    tx_ins.append(tx_in)
+                tx_outs = [TxOut(amount=29990000, script_pubkey=p2pkh_script(h160))]
+                txs.append(tx_class(1, tx_ins, tx_outs, 0, testnet=True))
+            hash_type = tx_class.default_hash_type
+            signers = [(i, private_keys[i % 2], hash_type, True, None) for i in range(3)]
+            # signing all at once gives the same transaction as one by one
+            self.assertTrue(txs[0].sign_inputs(signers))
+            for signer in signers:
+                self.assertTrue(txs[1].sign_input(*signer))
+            self.assertEqual(txs[0].serialize(), txs[1].serialize())
+            self.assertTrue(txs[0].verify())
+
+    def test_sign_input_schnorr(self):
+        private_key = PrivateKey(secret=8675309)
+        prev_tx = unhexlify('0025bc3c0fa8b7eb55b9437fdbd016870d18e0df0ace7bc9864efc38414147c8')
+        h160 = Tx.get_address_data('mzx5YhAH9kNHtcN481u6WkjeHjYtVeKVh2')['h160']
+        tx_ins = []
+        for i in range(3):
+            tx_in = TxIn(prev_tx, i, b'', 0xffffffff)
+            tx_in._value = 10000000
+            tx_in._script_pubkey = Script.parse(private_key.point.p2pkh_script())
+            tx_ins.append(tx_in)
+        tx_outs = [TxOut(amount=29990000, script_pubkey=p2pkh_script(h160))]
+        tx = BCHTx(1, tx_ins, tx_outs, 0, testnet=True)
+        hash_type = BCHTx.default_hash_type
+        self.assertTrue(tx.sign_input(0, private_key, hash_type, schnorr=True))
+        self.assertTrue(tx.sign_input(1, private_key, hash_type))
+        self.assertTrue(tx.sign_input(2, private_key, hash_type, schnorr=True))
+        self.assertEqual(len(tx.tx_ins[0].script_sig.elements[0]), 65)
+        self.assertTrue(tx.verify())
+        # a signature for another input doesn't verify
+        # sign_inputs and sign give the same signatures as sign_input
+        signed = tx.serialize()
+        tx.sign_inputs([(i, private_key, hash_type, True, None) for i in (0, 2)], schnorr=True)
+        tx.sign_input(1, private_key, hash_type)
+        self.assertEqual(tx.serialize(), signed)
+        tx.sign(private_key, schnorr=True)
+        self.assertEqual(len(tx.tx_ins[1].script_sig.elements[0]), 65)
+        self.assertTrue(tx.verify())
+        tx.tx_ins[2].script_sig = tx.tx_ins[0].script_sig
+        self.assertFalse(tx.verify_input(2))
+        self.assertFalse(tx.verify())
+
+    def test_schnorr_btg(self):
+        private_key = PrivateKey(secret=8675309)
+        prev_tx = unhexlify('0025bc3c0fa8b7eb55b9437fdbd016870d18e0df0ace7bc9864efc38414147c8')
+        h160 = Tx.get_address_data('mzx5YhAH9kNHtcN481u6WkjeHjYtVeKVh2')['h160']
+        tx_in = TxIn(prev_tx, 0, b'', 0xffffffff)
+        tx_in._value = 10000000
+        tx_in._script_pubkey = Script.parse(private_key.point.p2pkh_script())
+        tx_outs = [TxOut(amount=9990000, script_pubkey=p2pkh_script(h160))]
+        tx = BTGTx(1, [tx_in], tx_outs, 0, testnet=True)
+        hash_type = BTGTx.default_hash_type
+        # Bitcoin Gold and its forks don't have Schnorr signatures
+        with self.assertRaises(RuntimeError):
+            tx.sign_input(0, private_key, hash_type, schnorr=True)
+        with self.assertRaises(RuntimeError):
+            tx.sign(private_key, schnorr=True)
+        # and one put in by hand isn't taken for one
+        z = tx.signing_hash(0, hash_type)
+        sig = private_key.sign_schnorr(z).serialize() + bytes([hash_type])
+        tx.set_signature(0, sig, private_key.point.sec())
+        with self.assertRaises(RuntimeError):
+            tx.verify()
+
+    def test_sign_btv(self):
+        private_key = PrivateKey(secret=8675309)
+        prev_tx = unhexlify('0025bc3c0fa8b7eb55b9437fdbd016870d18e0df0ace7bc9864efc38414147c8')
+        h160 = Tx.get_address_data('mzx5YhAH9kNHtcN481u6WkjeHjYtVeKVh2')['h160']
+        tx_ins = []
+        for i in range(2):
+            tx_in = TxIn(prev_tx, i, b'', 0xffffffff)
+            tx_in._value = 10000000
+            tx_in._script_pubkey = Script.parse(private_key.point.p2pkh_script())
+            tx_ins.append(tx_in)
+        tx_outs = [TxOut(amount=19990000, script_pubkey=p2pkh_script(h160))]
+        tx = BTVTx(1, tx_ins, tx_outs, 0, testnet=True)
+        # p2pkh inputs are signed and checked with the fork id sig_hash
+        self.assertTrue(tx.sign_input(0, private_key, BTVTx.default_hash_type))
+        tx.sign(private_key)
+        self.assertTrue(tx.verify_input(1))
+        self.assertTrue(tx.verify())
+
     def test_is_coinbase(self):
         raw_tx = unhexlify('01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff5e03d71b07254d696e656420627920416e74506f6f6c20626a31312f4542312f4144362f43205914293101fabe6d6d678e2c8c34afc36896e7d9402824ed38e856676ee94bfdb0c6c4bcd8b2e5666a0400000000000000c7270000a5e00e00ffffffff01faf20b58000000001976a914338c84849423992471bffb1a54a8d9b1d69dc28a88ac00000000')
         stream = BytesIO(raw_tx)
@@ -206,6 +306,46 @@ class TxTest(TestCase):
         self.assertTrue(tx.verify_input(0))
         self.assertTrue(tx.verify())
 
+    def test_parse_cursor(self):
+        raw_tx = unhexlify('0100000001813f79011acb80925dfe69b3def355fe914bd1d96a3f5f71bf8303c6a989c7d1000000006b483045022100ed81ff192e75a3fd2304004dcadb746fa5e24c5031ccfcf21320b0277457c98f02207a986d955c6e0cb35d446a89d3f56100f4d7f67801c31967743a9c8e10615bed01210349fc4e631e3624a545de3f89f5d8684c7b8138bd94bdd531d2e213bf016b278afeffffff02a135ef01000000001976a914bc3b654dca7e56b04dca18f2566cdaf02e8d9ada88ac99c39800000000001976a9141c4bc762dd5423e332166702cb75f40df79fea1288ac19430600')
+        raw_segwit = unhexlify('01000000000101db6b1b20aa0fd7b23880be2ecbd4a98130974cf4748fb66092ac4d3ceb1a5477010000001716001479091972186c449eb1ded22b78e40d009bdf0089feffffff02b8b4eb0b000000001976a914a457b684d7f0d539a46a45bbc043f35b59d0d96388ac0008af2f000000001976a914fd270b1ee6abcaea97fea7ad0402e8bd8ad6d77c88ac02473044022047ac8e878352d3ebbde1c94ce3a10d057c24175747116f8288e5d794d12d482f0220217f36a485cae903c713331d877c1f64677e3622ad4010726870540656fe9dcb012103ad1d8e89212f0b92c74d23bb710c00662ad1470198ac48c43f7d6f93a2a2687392040000')
+        # one after the other out of the same buffer, as a stream would
+        for data in (raw_tx + raw_segwit, bytearray(raw_tx + raw_segwit)):
+            cursor = ByteCursor(data)
+            self.assertEqual(Tx.parse(cursor).serialize(), raw_tx)
+            self.assertEqual(Tx.parse(cursor).serialize(), raw_segwit)
+            self.assertEqual(cursor.remaining(), 0)
+        # a BytesIO is moved on past each one, like reading it would
+        stream = BytesIO(raw_tx + raw_segwit)
+        self.assertEqual(Tx.parse(stream).serialize(), raw_tx)
+        self.assertEqual(stream.tell(), len(raw_tx))
+        self.assertEqual(Tx.parse(stream).serialize(), raw_segwit)
+        self.assertEqual(stream.read(), b'')
+        tx_in = TxIn.parse(ByteCursor(raw_tx, 5))
+        self.assertEqual(tx_in.serialize(), TxIn.parse(BytesIO(raw_tx[5:])).serialize())
+        with self.assertRaises(RuntimeError):
+            Tx.parse(ByteCursor(raw_tx[:-10]))
+
+    def test_serialize_into(self):
+        raw_tx = unhexlify('0100000001813f79011acb80925dfe69b3def355fe914bd1d96a3f5f71bf8303c6a989c7d1000000006b483045022100ed81ff192e75a3fd2304004dcadb746fa5e24c5031ccfcf21320b0277457c98f02207a986d955c6e0cb35d446a89d3f56100f4d7f67801c31967743a9c8e10615bed01210349fc4e631e3624a545de3f89f5d8684c7b8138bd94bdd531d2e213bf016b278afeffffff02a135ef01000000001976a914bc3b654dca7e56b04dca18f2566cdaf02e8d9ada88ac99c39800000000001976a9141c4bc762dd5423e332166702cb75f40df79fea1288ac19430600')
+        raw_segwit = unhexlify('01000000000101db6b1b20aa0fd7b23880be2ecbd4a98130974cf4748fb66092ac4d3ceb1a5477010000001716001479091972186c449eb1ded22b78e40d009bdf0089feffffff02b8b4eb0b000000001976a914a457b684d7f0d539a46a45bbc043f35b59d0d96388ac0008af2f000000001976a914fd270b1ee6abcaea97fea7ad0402e8bd8ad6d77c88ac02473044022047ac8e878352d3ebbde1c94ce3a10d057c24175747116f8288e5d794d12d482f0220217f36a485cae903c713331d877c1f64677e3622ad4010726870540656fe9dcb012103ad1d8e89212f0b92c74d23bb710c00662ad1470198ac48c43f7d6f93a2a2687392040000')
+        # one after the other into the same writer
+        writer = ByteWriter()
+        Tx.parse(BytesIO(raw_tx)).serialize_into(writer)
+        Tx.parse(BytesIO(raw_segwit)).serialize_into(writer)
+        self.assertEqual(writer.getvalue(), raw_tx + raw_segwit)
+        # a scriptSig over 252 bytes gets a 3 byte varint for its length
+        script_sig = Script([bytes([i]) * 70 for i in range(5)]).serialize()
+        tx_in = TxIn(b'\x01' * 32, 2, script_sig, 0xffffffff)
+        want = b'\x01' * 32 + int_to_little_endian(2, 4) + encode_varint(len(script_sig)) + script_sig + b'\xff' * 4
+        self.assertEqual(len(encode_varint(len(script_sig))), 3)
+        self.assertEqual(tx_in.serialize(), want)
+        self.assertEqual(TxIn.parse(BytesIO(want)).serialize(), want)
+        # a prev_tx that isn't 32 bytes is an error, not padded or cut
+        for prev_tx in (b'\x01' * 31, b'\x01' * 33):
+            with self.assertRaises(RuntimeError):
+                TxIn(prev_tx, 2, script_sig, 0xffffffff).serialize()
+
     def test_segwit(self):
         raw_tx = unhexlify('01000000000101db6b1b20aa0fd7b23880be2ecbd4a98130974cf4748fb66092ac4d3ceb1a5477010000001716001479091972186c449eb1ded22b78e40d009bdf0089feffffff02b8b4eb0b000000001976a914a457b684d7f0d539a46a45bbc043f35b59d0d96388ac0008af2f000000001976a914fd270b1ee6abcaea97fea7ad0402e8bd8ad6d77c88ac02473044022047ac8e878352d3ebbde1c94ce3a10d057c24175747116f8288e5d794d12d482f0220217f36a485cae903c713331d877c1f64677e3622ad4010726870540656fe9dcb012103ad1d8e89212f0b92c74d23bb710c00662ad1470198ac48c43f7d6f93a2a2687392040000')
         stream = BytesIO(raw_tx)
@@ -270,6 +410,22 @@ class TxTest(TestCase):
         tx.tx_ins[1]._script_pubkey = Script.parse(p2pkh_script(h160))
         self.assertTrue(tx.verify())
 
+    def test_verify_batch(self):
+        raw = unhexlify('0200000002618c8a9c486a961e57e99c8a249cd43937f4447083a3c9589cc30eebb38e0d8d010000006a473044022075173f771f997652e94c461a22147c1154336fb498cfb2cc4a5af5d0b94f43960220322a22f4290a580e3f0953cff7ba548c63d0829936413fc805a802bb005881014121034a66bef852adc6fa774d95a7ebef5a2b18e3b61d05e23130b9a4ad6fffa536bdfeffffff8afa4e2c895facf0354e66910cf6ed02e8549eaad8926688dedb754781e118b2010000006a473044022025575c1912ae89a29a639fca6ac3d72423214dbff62afd7a48a358464585da0d022068706419a61e60a571c084797177856f514a9ecd8d8df2f2e113c5daa4e560f041210259316ac5f9f5fecb6597929de0cb05739432b067b79444a57adbf9e413fc61defeffffff021f7a1b1d000000001976a914dd23a9af489c2b1e08a13122aac1a06752df8ed188ac7af11400000000001976a914bd31883c773888a0f99e16deeff118ff0ec15d0888ac7dbf0700')
+        stream = BytesIO(raw)
+        tx = BTGTx.parse(stream)
+        tx.tx_ins[0]._value = 488779958
+        h160 = BTGTx.get_address_data('GWmfLaQ7ZKmUX7rmW63u63b9ghbuwr9yN1')['h160']
+        tx.tx_ins[0]._script_pubkey = Script.parse(p2pkh_script(h160))
+        # wrong value for the second input invalidates only its signature
+        tx.tx_ins[1]._value = 969978
+        h160 = BTGTx.get_address_data('GgvZtZ8aV1UhTgLzzRbXVLrwwVoJL9WywW')['h160']
+        tx.tx_ins[1]._script_pubkey = Script.parse(p2pkh_script(h160))
+        self.assertEqual(len(tx.input_signatures(0)), 1)
+        self.assertTrue(tx.verify_input(0))
+        self.assertFalse(tx.verify_input(1))
+        self.assertFalse(tx.verify())
+
     def test_bcd(self):
         raw = unhexlify('0c00000025b6923ff3cb4264408ed5d5cca3cc41c7586820c95aeec24503d5a11418dd2501d0b96dd7ff4e3de5113ca48cefcbb4083541154c75e51a2e7b09879301a71cc5000000006a47304402201e10a7a5d03235236475feede87c57a38a79ab3399aafe90fcb9c47de525603b0220547fd8897c0e9d318dbe6c350c784eeb31b3cb18fbf550516fcc0168c22810e5012103e97b79d9aa924bfcea2915235ebc5b4cc7db5414e63ccb61ed2d197e29cb9fdbffffffff0280cb7831000000001976a91449664b451210fc8b3c055ce5606f0d8199ceae6788ac5a434600000000001976a9148868e1942ff8445f2e3791d9fa1dc881b8aec08c88ac00000000')
         stream = BytesIO(raw)